@@ -7,6 +7,8 @@ __email__ = 'nicmust@nmbu.no'
 import random
 import walker_sim
 
+import numpy as np
+
 
 class BoundedWalker(walker_sim.Walker):
     def __init__(self, start, home, left_limit, right_limit):
@@ -87,10 +89,144 @@ class BoundedSimulation(walker_sim.Simulation):
 
         return walker.steps
 
+    def _chain(self):
+        """
+        Describes the walk as a Markov chain of counted steps. The walker
+        cannot pass home, so only the limit on the side of start matters.
+        States are distances u from that limit, from 0 to the distance of
+        home, which absorbs. From u = 0 the next counted step always goes
+        to 1, as steps out of bounds are undone and not counted, and from
+        other states to u - 1 or u + 1 with equal probability.
+
+        Returns
+        -------
+        tuple
+            (start state, home state)
+        """
+        limit = self.left_limit if self.start <= self.home \
+            else self.right_limit
+        return abs(self.start - limit), abs(self.home - limit)
+
+    def _solve(self, rhs):
+        """
+        Solves (I - Q) x = rhs for the transient states of the chain with
+        the Thomas algorithm for tridiagonal systems, in O(width) time.
+        Row 0 is x_0 - x_1, the other rows x_u - (x_(u-1) + x_(u+1)) / 2,
+        with x at home being 0.
+        """
+        n = len(rhs)
+        upper = np.full(n, -0.5)
+        upper[0] = -1.
+        new_upper = np.zeros(n)
+        new_rhs = np.zeros(n)
+        new_upper[0] = upper[0]
+        new_rhs[0] = rhs[0]
+        for u in range(1, n):
+            pivot = 1. + 0.5 * new_upper[u - 1]
+            new_upper[u] = upper[u] / pivot
+            new_rhs[u] = (rhs[u] + 0.5 * new_rhs[u - 1]) / pivot
+        x = np.zeros(n + 1)
+        for u in range(n - 1, -1, -1):
+            x[u] = new_rhs[u] - new_upper[u] * x[u + 1]
+        return x[:n]
+
+    def mean_steps(self):
+        """
+        Returns the exact expected number of counted steps from start to
+        home, from a tridiagonal solve of the absorbing chain.
+
+        Returns
+        -------
+        float
+            Expected number of steps
+        """
+        start, home = self._chain()
+        if start == home:
+            return 0.
+        return self._solve(np.ones(home))[start]
+
+    def variance_steps(self):
+        """
+        Returns the exact variance of the number of counted steps from
+        start to home. The second moments m solve the same system as the
+        means e, with right-hand side 2 * e - 1.
+
+        Returns
+        -------
+        float
+            Variance of the number of steps
+        """
+        start, home = self._chain()
+        if start == home:
+            return 0.
+        means = self._solve(np.ones(home))
+        second_moments = self._solve(2 * means - 1)
+        return second_moments[start] - means[start] ** 2
+
+    def first_passage_distribution(self, max_steps):
+        """
+        Computes the exact distribution of the number of counted steps
+        from start to home, by propagating the probabilities of the
+        absorbing chain step by step, in O(width * max_steps) time.
+        sample_first_passage draws walks from it.
+
+        Arguments
+        ---------
+        max_steps : int
+            Last number of steps to compute
+
+        Returns
+        -------
+        np.ndarray
+            Element n is the probability that the walk takes n steps, for
+            n = 0, ..., max_steps. The missing mass is the probability of
+            more than max_steps steps.
+        """
+        start, home = self._chain()
+        pmf = np.zeros(max_steps + 1)
+        if start == home:
+            pmf[0] = 1.
+            return pmf
+        state = np.zeros(home)
+        state[start] = 1.
+        for n in range(1, max_steps + 1):
+            new_state = np.zeros(home + 1)
+            new_state[1] = state[0]
+            new_state[:-2] += 0.5 * state[1:]
+            new_state[2:] += 0.5 * state[1:]
+            pmf[n] = new_state[home]
+            state = new_state[:home]
+        return pmf
+
+    def _home_hits(self, path):
+        """
+        Used by run_batch_simulation, which runs the bounded walk as a
+        free walk folded onto the interval between the limits. A step
+        out of bounds is undone and not counted, so at a limit the next
+        counted step always goes back inwards. The free walk mirrored at
+        the limits with period 2 * width moves the same way: from a limit
+        both of its steps fold back to the neighbouring square. Home is
+        hit where the folded position is home.
+
+        Arguments
+        ---------
+        path : np.ndarray
+            Positions of the free walk
+
+        Returns
+        -------
+        np.ndarray
+            True where the bounded walker is at home
+        """
+        period = 2 * (self.right_limit - self.left_limit)
+        offset = self.home - self.left_limit
+        folded = (path - self.left_limit) % period
+        return (folded == offset) | (folded == (period - offset) % period)
+
 
 if __name__ == "__main__":
     left_limits = [0, -10, -100, -1000, -10000]
     for left_limit in left_limits:
         bounded_sim = BoundedSimulation(0, 20, 12345, left_limit, 20)
         print(f"left_limit: {left_limit}, "
-              f"number of steps:", bounded_sim.run_simulation(20))
+              f"number of steps:", bounded_sim.run_batch_simulation(20))
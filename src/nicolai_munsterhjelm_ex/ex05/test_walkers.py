@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the batch engines and exact solvers of walker_sim and
+bounded_sim.
+"""
+
+import pytest
+
+from walker_sim import Simulation
+from bounded_sim import BoundedSimulation
+
+__author__ = 'Nicolai Munsterhjelm'
+__email__ = 'nicmust@nmbu.no'
+
+
+def test_batch_simulation():
+    """Test that the batch engine returns valid step counts."""
+
+    start, home, seed, n_sim = 10, 14, 12345, 200
+    s = Simulation(start, home, seed)
+    r = s.run_batch_simulation(n_sim, max_block_cells=1000)
+    assert len(r) == n_sim
+    assert all(isinstance(rs, int) for rs in r)
+    assert all(rs >= home - start and (rs - start - home) % 2 == 0
+               for rs in r)
+    assert Simulation(3, 3, seed).run_batch_simulation(2) == [0, 0]
+
+
+def test_bounded_batch_simulation():
+    """Test that the bounded batch engine does not count reflected steps,
+    by comparing with the expected number of steps from the left limit to
+    home at the right limit, (right - left) ** 2."""
+
+    s = BoundedSimulation(0, 10, 12345, 0, 10)
+    r = s.run_batch_simulation(2000)
+    assert len(r) == 2000
+    assert all(rs >= 10 and rs % 2 == 0 for rs in r)
+    assert 90 < sum(r) / len(r) < 110
+
+
+def test_max_steps():
+    """Test that max_steps stops long walks."""
+
+    s = Simulation(0, 5, 12345)
+    r = s.run_batch_simulation(500, max_block_cells=1000, max_steps=40)
+    assert len(r) == 500
+    assert None in r
+    assert all(rs is None or 5 <= rs <= 40 for rs in r)
+
+
+def test_first_passage_sampling():
+    """Test the first passage distribution against the known terms for
+    distance one, 1/2, 1/8 and 1/16, and that the sampled walks agree
+    with the batch engine."""
+
+    s = Simulation(3, 2, 12345)
+    p = s.first_passage_distribution(5)
+    assert list(p) == pytest.approx([0, 0.5, 0, 0.125, 0, 0.0625])
+    r = s.sample_first_passage(2000, 5)
+    assert set(r) == {1, 3, 5, None}
+    assert 0.45 < r.count(1) / len(r) < 0.55
+
+    s = Simulation(0, 4, 12345)
+    sampled = s.sample_first_passage(4000, 100)
+    simulated = s.run_batch_simulation(4000, max_steps=100)
+    assert abs(sampled.count(None) - simulated.count(None)) < 200
+
+
+def test_bounded_exact_solver():
+    """Test the exact mean, variance and distribution of the bounded walk
+    against the closed forms for a walk from the limit, n ** 2 and
+    2 / 3 * (n ** 4 - n ** 2), and against Monte Carlo."""
+
+    s = BoundedSimulation(0, 6, 12345, 0, 10)
+    assert s.mean_steps() == pytest.approx(36)
+    assert s.variance_steps() == pytest.approx(2 / 3 * (6 ** 4 - 6 ** 2))
+
+    s = BoundedSimulation(2, -3, 12345, -5, 4)
+    r = s.run_simulation(2000)
+    mean = sum(r) / len(r)
+    variance = sum((rs - mean) ** 2 for rs in r) / (len(r) - 1)
+    assert s.mean_steps() == pytest.approx(mean, rel=0.1)
+    assert s.variance_steps() == pytest.approx(variance, rel=0.2)
+    p = s.first_passage_distribution(30)
+    assert sum(p) == pytest.approx(sum(rs <= 30 for rs in r) / len(r),
+                                   abs=0.05)
+    assert p[5] == pytest.approx(1 / 32)
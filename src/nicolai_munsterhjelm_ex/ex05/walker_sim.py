@@ -6,6 +6,8 @@ __email__ = 'nicmust@nmbu.no'
 
 import random
 
+import numpy as np
+
 
 class Walker:
     def __init__(self, start, home):
@@ -96,6 +98,134 @@ class Simulation:
 
         return number_of_steps
 
+    def run_batch_simulation(self, num_walks, max_block_cells=2**22,
+                             max_steps=None):
+        """
+        Vectorized alternative to run_simulation. All walkers move
+        together: blocks of +1/-1 steps are drawn as an array, the
+        positions along each block are found with a cumulative sum, and
+        walkers that reach home within a block are retired with the
+        number of steps up to their first visit. The blocks get longer as
+        walkers are retired, so that each holds about max_block_cells
+        steps.
+        The steps are drawn from a NumPy generator seeded from the random
+        module, so the results are statistically, not walk by walk, equal
+        to run_simulation.
+
+        Arguments
+        ---------
+        num_walks : int
+            The number of walks to simulate
+        max_block_cells : int
+            Number of steps drawn at a time for all walkers together
+        max_steps : int
+            Walks that have not reached home after max_steps steps are
+            stopped, None lets them run until they do. Unbounded walks
+            have no finite mean duration, so without a cap a few very
+            long walks can stall the run.
+
+        Returns
+        -------
+        list[int]
+            List with the number of steps per walk, None for walks
+            stopped by max_steps
+        """
+        rng = np.random.default_rng(random.getrandbits(64))
+        position = np.full(num_walks, self.start, dtype=np.int64)
+        steps = np.zeros(num_walks, dtype=np.int64)
+        active = np.flatnonzero(position != self.home)
+        # All walkers still out have taken the same number of steps.
+        elapsed = 0
+
+        while active.size > 0 and (max_steps is None
+                                   or elapsed < max_steps):
+            block_size = max(16, max_block_cells // active.size)
+            if max_steps is not None:
+                block_size = min(block_size, max_steps - elapsed)
+            moves = rng.integers(0, 2, size=(active.size, block_size),
+                                 dtype=np.int8) * np.int8(2) - np.int8(1)
+            path = position[active, None] + np.cumsum(moves, axis=1)
+            hit = self._home_hits(path)
+            arrived = hit.any(axis=1)
+            steps[active[arrived]] = elapsed + hit[arrived].argmax(axis=1) \
+                + 1
+            position[active] = path[:, -1]
+            elapsed += block_size
+            active = active[~arrived]
+
+        number_of_steps = steps.tolist()
+        for walk in active.tolist():
+            number_of_steps[walk] = None
+        return number_of_steps
+
+    def first_passage_distribution(self, max_steps):
+        """
+        Computes the exact distribution of the number of steps of an
+        unbounded walk from start to home, from
+        P(n steps) = d / n * C(n, (n + d) / 2) / 2**n for distance d and
+        n = d, d + 2, ... The terms are built from the ratio of
+        neighbouring terms, in logarithms, so that no large binomial
+        coefficients are formed.
+
+        Arguments
+        ---------
+        max_steps : int
+            Last number of steps to compute
+
+        Returns
+        -------
+        np.ndarray
+            Element n is the probability that the walk takes n steps, for
+            n = 0, ..., max_steps. The missing mass is the probability of
+            more than max_steps steps.
+        """
+        distance = abs(self.home - self.start)
+        pmf = np.zeros(max_steps + 1)
+        if distance == 0:
+            pmf[0] = 1.
+            return pmf
+        if distance > max_steps:
+            return pmf
+        n = np.arange(distance, max_steps - 1, 2, dtype=np.float64)
+        k = (n + distance) / 2
+        log_ratio = np.log(n * (n + 1) / (4 * (k + 1) * (n + 1 - k)))
+        log_pmf = -distance * np.log(2) + np.concatenate(
+            ([0.], np.cumsum(log_ratio)))
+        pmf[distance::2] = np.exp(log_pmf)
+        return pmf
+
+    def sample_first_passage(self, num_walks, max_steps):
+        """
+        Draws the number of steps of num_walks unbounded walks directly
+        from first_passage_distribution, without simulating the steps.
+        The time does not depend on the length of the walks, but the
+        distribution table takes memory proportional to max_steps.
+
+        Arguments
+        ---------
+        num_walks : int
+            The number of walks to simulate
+        max_steps : int
+            Longest walk that is sampled
+
+        Returns
+        -------
+        list[int]
+            List with the number of steps per walk, None for walks that
+            take more than max_steps steps
+        """
+        rng = np.random.default_rng(random.getrandbits(64))
+        cdf = np.cumsum(self.first_passage_distribution(max_steps))
+        steps = np.searchsorted(cdf, rng.random(num_walks), side='right')
+        number_of_steps = steps.tolist()
+        for walk in np.flatnonzero(steps > max_steps).tolist():
+            number_of_steps[walk] = None
+        return number_of_steps
+
+    def _home_hits(self, path):
+        """Returns True where positions of the free walk are at home."""
+        return path == self.home
+
 
 if __name__ == "__main__":
     sim = Simulation(0, 10, 12345)
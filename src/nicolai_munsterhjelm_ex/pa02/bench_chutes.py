@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for chutes_simulation.
+
+Times single_game, run_simulation, run_batch_simulation and the result
+queries for each player type and a mixed field, on the default board and
+on generated boards with goals from 90 to 10 000. Reports games per
+second and peak memory and writes them to JSON so that runs on different
+commits can be compared.
+
+Run from this directory:
+
+    python bench_chutes.py --games 2000 --output bench.json
+"""
+
+__author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
+__email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
+
+import argparse
+import json
+import random
+import subprocess
+import time
+import tracemalloc
+
+import chutes_simulation as cs
+
+FIELDS = {
+    'Player': [cs.Player] * 4,
+    'ResilientPlayer': [cs.ResilientPlayer] * 4,
+    'LazyPlayer': [cs.LazyPlayer] * 4,
+    'mixed': [cs.Player, cs.ResilientPlayer, cs.LazyPlayer, cs.Player],
+}
+
+GOALS = [90, 1000, 10000]
+
+
+def make_board(goal, density=0.15, seed=1):
+    """
+    Generates a board with about density * goal chutes and ladders,
+    half of each. Chutes and ladders span at most max(10, goal // 50)
+    squares, so game length grows with the goal.
+    Parameters
+    ----------
+    goal: int
+    density: float (share of squares that start a chute or ladder)
+    seed: int
+
+    Returns
+    -------
+    Board
+    """
+    if goal == 90:
+        return cs.Board()
+    rng = random.Random(seed)
+    span = max(10, goal // 50)
+    starts = rng.sample(range(2, goal - 1), int(density * goal))
+    half = len(starts) // 2
+    ladders = [(start, rng.randint(start + 1, min(start + span, goal - 1)))
+               for start in starts[:half]]
+    chutes = [(start, rng.randint(max(1, start - span), start - 1))
+              for start in starts[half:]]
+    return cs.Board(ladders=ladders, chutes=chutes, goal=goal)
+
+
+def _measure(function, num_games):
+    """
+    Runs function twice, once timed and once while tracing memory, since
+    tracing slows down the Python code a lot.
+    Returns
+    -------
+    dict: {'seconds': ..., 'games_per_sec': ..., 'peak_memory_bytes': ...}
+    """
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds,
+            'games_per_sec': num_games / seconds if seconds else None,
+            'peak_memory_bytes': peak}
+
+
+def _single_games(sim, num_games):
+    for _ in range(num_games):
+        sim.single_game()
+
+
+def _queries(sim):
+    sim.winners_per_type()
+    sim.durations_per_type()
+    sim.players_per_type()
+
+
+def run_benchmarks(num_games=2000, goals=None, fields=None, seed=1):
+    """
+    Runs all benchmark cases. The number of games is scaled down on
+    large boards, where games take proportionally more moves.
+    Parameters
+    ----------
+    num_games: int (games per case on the default board)
+    goals: list of int (board sizes, default GOALS)
+    fields: list of str (keys of FIELDS, default all)
+    seed: int
+
+    Returns
+    -------
+    list: one dict per case and method
+    """
+    goals = GOALS if goals is None else goals
+    fields = list(FIELDS) if fields is None else fields
+
+    results = []
+    for goal in goals:
+        board = make_board(goal, seed=seed)
+        games = max(1, num_games * 90 // goal)
+        for field_name in fields:
+            field = FIELDS[field_name]
+            case = {'goal': goal, 'field': field_name, 'games': games}
+
+            random.seed(seed)
+            sim = cs.Simulation(list(field), board, seed)
+            results.append(dict(case, method='single_game', **_measure(
+                lambda: _single_games(sim, games), games)))
+            results.append(dict(case, method='run_simulation', **_measure(
+                lambda: sim.run_simulation(games), games)))
+            results.append(dict(case, method='run_batch_simulation',
+                                **_measure(
+                                    lambda: sim.run_batch_simulation(games),
+                                    games)))
+            results.append(dict(case, method='queries', **_measure(
+                lambda: _queries(sim), len(sim.get_results()))))
+    return results
+
+
+def _git_commit():
+    """Returns the current git commit, or None outside a repository."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--games', type=int, default=2000,
+                        help='games per case on the default board')
+    parser.add_argument('--goals', type=int, nargs='+', default=GOALS)
+    parser.add_argument('--fields', nargs='+', choices=list(FIELDS),
+                        default=list(FIELDS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON file to write results to')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.games, args.goals, args.fields,
+                             args.seed)
+    for row in results:
+        print(f"goal {row['goal']:>6} {row['field']:<16}"
+              f"{row['method']:<22}{row['games_per_sec']:>14.0f} games/s"
+              f"{row['peak_memory_bytes'] / 2**20:>10.2f} MiB")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'commit': _git_commit(), 'time': time.time(),
+                       'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
+__email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
+
+import os
+import pickle
+
+import numpy as np
+
+RECORD = np.dtype([('turns', '<u4'), ('winner', 'u1')])
+
+
+class CheckpointFile:
+    def __init__(self, path):
+        """
+        Checkpoint of a long simulation run, stored as two files.
+        The results file at path is a flat binary array of RECORD entries
+        that is only ever appended to, so it can be memory-mapped with
+        np.memmap. The state file at path + '.state' holds the settings
+        of the run, the number of games done and the RNG state. It is
+        replaced atomically after the results are on disk, so a killed
+        process always leaves a consistent checkpoint behind.
+        Parameters
+        ----------
+        path: str (path of the results file)
+        """
+        self.path = path
+        self.state_path = path + '.state'
+
+    def create(self, state):
+        """
+        Starts a new checkpoint with no results.
+        Parameters
+        ----------
+        state: dict (settings and RNG state of the run)
+        """
+        open(self.path, 'wb').close()
+        self.write_state(state)
+
+    def write_state(self, state):
+        """Atomically replaces the state file."""
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'wb') as state_file:
+            pickle.dump(state, state_file)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(temp_path, self.state_path)
+
+    def load_state(self):
+        """
+        Returns
+        -------
+        dict: state of the last checkpoint
+        """
+        with open(self.state_path, 'rb') as state_file:
+            return pickle.load(state_file)
+
+    def append(self, turns, codes, state):
+        """
+        Appends results and then records the new state.
+        Parameters
+        ----------
+        turns: sequence of int (durations)
+        codes: sequence of int (winner type codes)
+        state: dict (state after these games)
+        """
+        records = np.empty(len(turns), dtype=RECORD)
+        records['turns'] = turns
+        records['winner'] = codes
+        with open(self.path, 'ab') as results_file:
+            results_file.write(records.tobytes())
+            results_file.flush()
+            os.fsync(results_file.fileno())
+        self.write_state(state)
+
+    def truncate(self, num_games):
+        """Drops results written after the last state was recorded."""
+        with open(self.path, 'r+b') as results_file:
+            results_file.truncate(num_games * RECORD.itemsize)
+
+    def records(self, num_games=None):
+        """
+        Memory-maps the stored results.
+        Parameters
+        ----------
+        num_games: int (number of records to map, all if None)
+
+        Returns
+        -------
+        np.ndarray: read-only array of RECORD entries
+        """
+        if num_games is None:
+            num_games = os.path.getsize(self.path) // RECORD.itemsize
+        if num_games == 0:
+            return np.empty(0, dtype=RECORD)
+        return np.memmap(self.path, dtype=RECORD, mode='r',
+                         shape=(num_games,))
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""
+Dice backends for chutes_simulation.
+
+A backend is created from a seed and has a roll() method returning a die
+roll from 1 to 6, plus getstate() and setstate() so that checkpointed
+runs can be continued.
+"""
+
+__author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
+__email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
+
+import random
+
+import numpy as np
+
+
+class StdlibDice:
+    def __init__(self, seed=None):
+        """
+        Dice from a private random.Random instance. Uses random() instead
+        of the slower randint().
+        Parameters
+        ----------
+        seed: int
+        """
+        self._random = random.Random(seed)
+        self._uniform = self._random.random
+
+    def roll(self):
+        """Returns a die roll from 1 to 6."""
+        return int(self._uniform() * 6) + 1
+
+    def getstate(self):
+        return self._random.getstate()
+
+    def setstate(self, state):
+        self._random.setstate(state)
+
+
+class NumpyDice:
+    def __init__(self, seed=None, block_size=65536):
+        """
+        Dice from a NumPy Generator. Rolls are drawn in blocks of
+        block_size and handed out one by one from a buffer.
+        Parameters
+        ----------
+        seed: int
+        block_size: int (number of rolls drawn at a time)
+        """
+        self._rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._buffer = []
+        self._next = iter(self._buffer).__next__
+
+    def _refill(self):
+        """Draws a new block of rolls."""
+        self._buffer = self._rng.integers(1, 7, self.block_size).tolist()
+        self._next = iter(self._buffer).__next__
+
+    def roll(self):
+        """Returns a die roll from 1 to 6."""
+        try:
+            return self._next()
+        except StopIteration:
+            self._refill()
+            return self._next()
+
+    def _drain(self):
+        """Removes and returns the rolls left in the buffer."""
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._next())
+            except StopIteration:
+                break
+        self._buffer = []
+        self._next = iter(self._buffer).__next__
+        return remaining
+
+    def take_rolls(self):
+        """
+        Hands out all buffered rolls at once, or a new block if the buffer
+        is empty, for engines that consume rolls as arrays.
+        Returns
+        -------
+        np.ndarray: die rolls
+        """
+        remaining = self._drain()
+        if remaining:
+            return np.array(remaining, dtype=np.int64)
+        return self._rng.integers(1, 7, self.block_size)
+
+    def unread(self, rolls):
+        """Puts rolls that were taken but not used back in front of the
+        buffer."""
+        self._buffer = [int(roll) for roll in rolls] + self._drain()
+        self._next = iter(self._buffer).__next__
+
+    def getstate(self):
+        remaining = self._drain()
+        self.unread(remaining)
+        return self._rng.bit_generator.state, remaining
+
+    def setstate(self, state):
+        self._rng.bit_generator.state, remaining = state
+        self._buffer = list(remaining)
+        self._next = iter(self._buffer).__next__
+
+
+class LCGDice:
+    a = 7**5
+    m = 2**31 - 1
+
+    def __init__(self, seed=1):
+        """
+        Dice from the linear congruential generator of LCGRand in ex05,
+        scaled from 1 to m - 1 down to 1 to 6.
+        Parameters
+        ----------
+        seed: int (must not be a multiple of m)
+        """
+        if seed is None:
+            seed = 1
+        self.hidden_state = seed % self.m
+        if self.hidden_state == 0:
+            raise ValueError('LCGDice seed must not be a multiple of '
+                             '2**31 - 1')
+
+    def roll(self):
+        """Returns a die roll from 1 to 6."""
+        self.hidden_state = (self.a * self.hidden_state) % self.m
+        return self.hidden_state * 6 // self.m + 1
+
+    def getstate(self):
+        return self.hidden_state
+
+    def setstate(self, state):
+        self.hidden_state = state
+
+
+class ReplayDice:
+    def __init__(self, source):
+        """
+        Dice that can replay the rolls of a game, for common random
+        numbers. Rolls are taken from source and kept, rewind() starts the
+        same sequence again and next_game() forgets it.
+        Parameters
+        ----------
+        source: dice backend the rolls are drawn from
+        """
+        self._source = source.roll
+        self._rolls = []
+        self._index = 0
+
+    def roll(self):
+        """Returns the next roll of the game, drawing it if needed."""
+        if self._index == len(self._rolls):
+            self._rolls.append(self._source())
+        self._index += 1
+        return self._rolls[self._index - 1]
+
+    def rewind(self):
+        """Starts the rolls of the current game from the beginning."""
+        self._index = 0
+
+    def next_game(self):
+        """Forgets the rolls of the current game."""
+        self._rolls = []
+        self._index = 0
+
+
+DICE = {'stdlib': StdlibDice, 'numpy': NumpyDice, 'lcg': LCGDice}
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compiled game loop for chutes_simulation.
+
+play_games runs whole games over the transition table of a board with the
+player state kept in plain typed variables. It is compiled with Numba when
+Numba is installed and runs as ordinary Python otherwise.
+"""
+
+__author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
+__email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _play_games(table, goal, extra, dropped, lazy, rolls, max_games,
+                turns_out, winner_out):
+    """
+    Plays games with the rolls in rolls, taken in the order the players
+    move, exactly like the move methods of Player, ResilientPlayer and
+    LazyPlayer.
+    Parameters
+    ----------
+    table: transition table of the board
+    goal: int
+    extra: extra steps per slot, 0 for players that are not resilient
+    dropped: dropped steps per slot
+    lazy: True for lazy slots
+    rolls: die rolls
+    max_games: int (stop after this many games)
+    turns_out: array the duration of each game is written to
+    winner_out: array the winning slot of each game is written to
+
+    Returns
+    -------
+    tuple: (number of games played, index of the first roll not used).
+    If the rolls run out during a game, that game is not counted and the
+    index is that of its first roll, so it can be played again with more
+    rolls.
+    """
+    num_players = len(extra)
+    num_rolls = len(rolls)
+    last_square = len(table) - 1
+    index = 0
+    games = 0
+    while games < max_games:
+        start = index
+        position = [0] * num_players
+        flag = [False] * num_players
+        round_num = 0
+        playing = True
+        while playing:
+            round_num += 1
+            for slot in range(num_players):
+                if index == num_rolls:
+                    return games, start
+                roll = rolls[index]
+                index += 1
+                current = position[slot]
+                if lazy[slot]:
+                    if flag[slot]:
+                        intermediate = current + roll - dropped[slot]
+                        if intermediate < current:
+                            intermediate = current
+                    else:
+                        intermediate = current + roll
+                else:
+                    intermediate = current + roll
+                    if flag[slot]:
+                        intermediate += extra[slot]
+                        flag[slot] = False
+                if intermediate <= last_square:
+                    end = table[intermediate]
+                else:
+                    end = intermediate
+                if lazy[slot]:
+                    if end > intermediate:
+                        flag[slot] = True
+                elif extra[slot] and end < intermediate:
+                    flag[slot] = True
+                position[slot] = end
+                if end >= goal:
+                    turns_out[games] = round_num
+                    winner_out[games] = slot
+                    games += 1
+                    playing = False
+                    break
+    return games, index
+
+
+if njit is None:
+    play_games = _play_games
+    COMPILED = False
+else:
+    play_games = njit(cache=True)(_play_games)
+    COMPILED = True
+
+
+def run_games(table, goal, extra, dropped, lazy, dice, num_games,
+              turns_out, winner_out):
+    """
+    Plays num_games games with rolls taken in blocks from dice, a
+    chutes_dice.NumpyDice. Rolls left over after the last game are handed
+    back to dice, so the dice stream continues as if the games had been
+    played with Player.move.
+    Without Numba, the arrays are converted to lists, which are faster
+    to index from plain Python.
+    """
+    if not COMPILED:
+        table, extra, dropped, lazy = (table.tolist(), extra.tolist(),
+                                       dropped.tolist(), lazy.tolist())
+    rolls = dice.take_rolls()
+    done = 0
+    while True:
+        block = rolls if COMPILED else rolls.tolist()
+        games, index = play_games(table, goal, extra, dropped, lazy, block,
+                                  num_games - done, turns_out[done:],
+                                  winner_out[done:])
+        done += games
+        if done == num_games:
+            break
+        rolls = np.concatenate([rolls[index:], dice.take_rolls()])
+    dice.unread(rolls[index:])
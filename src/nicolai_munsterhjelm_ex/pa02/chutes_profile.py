@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
+__email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
+
+import json
+from collections import Counter
+from time import perf_counter
+
+import numpy as np
+
+PHASES = ('dice', 'board', 'goal_check', 'bookkeeping')
+
+
+class _CountingSquares:
+    def __init__(self, profiler, squares):
+        """
+        Stands in for the transition list of a board in an instrumented
+        player, counting chute and ladder hits per square.
+        """
+        self._profiler = profiler
+        self._squares = squares
+
+    def __len__(self):
+        return len(self._squares)
+
+    def __getitem__(self, position):
+        profiler = self._profiler
+        if profiler.sampling:
+            start = perf_counter()
+            end = self._squares[position]
+            profiler.phase_seconds['board'] += perf_counter() - start
+        else:
+            end = self._squares[position]
+        if end > position:
+            profiler.ladder_hits[position] += 1
+        elif end < position:
+            profiler.chute_hits[position] += 1
+        return end
+
+
+class MoveProfiler:
+    def __init__(self, board, sample_every=100):
+        """
+        Instrumentation of the game loop. Counts ladder and chute hits per
+        square and moves per game, and times the phases of every
+        sample_every-th move: dice roll, board lookup, goal check and the
+        remaining player bookkeeping. The bookkeeping time includes the
+        overhead of the timers.
+        The profiler plays its own instrumented players, so the players
+        of the normal game loop are not touched. The hit counters grow
+        with the table when the board is changed in place.
+        Parameters
+        ----------
+        board: Board
+        sample_every: int (time one move out of this many)
+        """
+        self.board = board
+        self.sample_every = sample_every
+        self.sampling = False
+        self.ladder_hits = np.zeros(len(board.table), dtype=np.int64)
+        self.chute_hits = np.zeros(len(board.table), dtype=np.int64)
+        self._table_version = board.table_version
+        self.moves_per_game = Counter()
+        self.phase_seconds = dict.fromkeys(('dice', 'board', 'goal_check',
+                                            'move'), 0.)
+        self.num_moves = 0
+        self.sampled_moves = 0
+        self._field = None
+        self._players = []
+
+    def _follow_table(self):
+        """Grows the hit counters to a table enlarged since the last
+        game, keeping the counts so far."""
+        self._table_version = self.board.table_version
+        missing = len(self.board.table) - len(self.ladder_hits)
+        if missing > 0:
+            self.ladder_hits = np.append(
+                self.ladder_hits, np.zeros(missing, dtype=np.int64))
+            self.chute_hits = np.append(
+                self.chute_hits, np.zeros(missing, dtype=np.int64))
+
+    def instrument(self, player):
+        """Makes player report its dice rolls and board lookups."""
+        roll = player._roll
+
+        def timed_roll():
+            if self.sampling:
+                start = perf_counter()
+                result = roll()
+                self.phase_seconds['dice'] += perf_counter() - start
+                return result
+            return roll()
+
+        player._roll = timed_roll
+        player._squares = _CountingSquares(self, self.board._squares)
+
+    def play_game(self, player_field, dice=None):
+        """
+        Plays a single game with instrumented players.
+        Parameters
+        ----------
+        player_field: list (player types)
+        dice: dice backend, None for the random module
+
+        Returns
+        -------
+        Tuple : (turns , winning player type)
+        """
+        if self._table_version != self.board.table_version:
+            self._follow_table()
+        if self._field != player_field:
+            self._players = [cl(self.board) for cl in player_field]
+            for player in self._players:
+                if dice is not None:
+                    player.set_dice(dice)
+                self.instrument(player)
+            self._field = list(player_field)
+        for player in self._players:
+            player.reset()
+        goal_reached = self.board.goal_reached
+
+        moves = 0
+        while True:
+            for player in self._players:
+                moves += 1
+                self.sampling = (self.num_moves + moves) \
+                    % self.sample_every == 0
+                if self.sampling:
+                    start = perf_counter()
+                    player.move()
+                    moved = perf_counter()
+                    won = goal_reached(player.position)
+                    self.phase_seconds['goal_check'] += \
+                        perf_counter() - moved
+                    self.phase_seconds['move'] += moved - start
+                    self.sampled_moves += 1
+                    self.sampling = False
+                else:
+                    player.move()
+                    won = goal_reached(player.position)
+                if won:
+                    self.num_moves += moves
+                    self.moves_per_game[moves] += 1
+                    return player.turns, player.__class__.__name__
+
+    def report(self):
+        """
+        Returns
+        -------
+        dict: counts and mean time per move and phase in nanoseconds
+        """
+        seconds = dict(self.phase_seconds)
+        seconds['bookkeeping'] = seconds['move'] - seconds['dice'] \
+            - seconds['board']
+        num_games = sum(self.moves_per_game.values())
+        return {
+            'games': num_games,
+            'moves': self.num_moves,
+            'mean_moves_per_game': self.num_moves / num_games
+            if num_games else None,
+            'moves_per_game': dict(sorted(self.moves_per_game.items())),
+            'sampled_moves': self.sampled_moves,
+            'ns_per_move': {phase: 1e9 * seconds[phase] / self.sampled_moves
+                            if self.sampled_moves else None
+                            for phase in PHASES},
+            'ladder_hits': {int(square): int(self.ladder_hits[square])
+                            for square in np.flatnonzero(self.ladder_hits)},
+            'chute_hits': {int(square): int(self.chute_hits[square])
+                           for square in np.flatnonzero(self.chute_hits)},
+        }
+
+    def heatmap(self, width=10):
+        """
+        Lays out the chute and ladder hits of the squares below the goal
+        in rows of width squares, for plotting with e.g. plt.imshow.
+        Returns
+        -------
+        np.ndarray: shape (rows, width), hits per square, nan past the goal
+        """
+        hits = (self.ladder_hits + self.chute_hits)[:self.board.goal]
+        rows = -(-len(hits) // width)
+        grid = np.full(rows * width, np.nan)
+        grid[:len(hits)] = hits
+        return grid.reshape(rows, width)
+
+    def save_report(self, path, width=10):
+        """Writes the report and the heatmap to a JSON file."""
+        report = self.report()
+        report['heatmap'] = [[None if np.isnan(hits) else int(hits)
+                              for hits in row]
+                             for row in self.heatmap(width)]
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
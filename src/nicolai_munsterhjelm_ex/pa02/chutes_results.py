@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
+__email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
+
+from collections import Counter
+from collections.abc import Sequence
+
+import numpy as np
+
+
+class ResultAggregator:
+    def __init__(self):
+        """
+        Keeps running statistics of simulation results without storing
+        the individual games. For every player type it keeps the number
+        of wins, a histogram of game durations and the running mean and
+        sum of squared deviations of the durations (Welford's method).
+        Memory use per player type is bounded by the longest game, and
+        all queries are independent of the number of games.
+        """
+        self._stats = {}
+        self._histograms = {}
+
+    def add(self, turns, player_type):
+        """
+        Adds the result of a single game.
+        Parameters
+        ----------
+        turns: int (duration of the game)
+        player_type: str (name of the winning player type)
+        """
+        if player_type not in self._stats:
+            self._stats[player_type] = [0, 0., 0.]
+            self._histograms[player_type] = Counter()
+        stats = self._stats[player_type]
+        stats[0] += 1
+        delta = turns - stats[1]
+        stats[1] += delta / stats[0]
+        stats[2] += delta * (turns - stats[1])
+        self._histograms[player_type][turns] += 1
+
+    def add_many(self, turns, player_type):
+        """
+        Adds the results of several games won by the same player type,
+        merging their statistics with those already collected.
+        Parameters
+        ----------
+        turns: np.ndarray (durations of the games)
+        player_type: str (name of the winning player type)
+        """
+        turns = np.asarray(turns)
+        if turns.size == 0:
+            return
+        if player_type not in self._stats:
+            self._stats[player_type] = [0, 0., 0.]
+            self._histograms[player_type] = Counter()
+        stats = self._stats[player_type]
+
+        count = turns.size
+        mean = turns.mean()
+        m2 = ((turns - mean) ** 2).sum()
+        total = stats[0] + count
+        delta = mean - stats[1]
+        stats[1] += delta * count / total
+        stats[2] += m2 + delta ** 2 * stats[0] * count / total
+        stats[0] = total
+
+        counts = np.bincount(turns)
+        nonzero = np.flatnonzero(counts)
+        self._histograms[player_type].update(
+            dict(zip(nonzero.tolist(), counts[nonzero].tolist())))
+
+    @property
+    def num_games(self):
+        """int: Number of games added"""
+        return sum(stats[0] for stats in self._stats.values())
+
+    def winners_per_type(self):
+        """
+        Returns
+        -------
+        dict:{'Player type' : number of wins, ......}
+        """
+        return {name: stats[0] for name, stats in self._stats.items()}
+
+    def mean_duration_per_type(self):
+        """
+        Returns
+        -------
+        dict:{'Player type' : mean duration of games won, ......}
+        """
+        return {name: stats[1] for name, stats in self._stats.items()}
+
+    def variance_duration_per_type(self):
+        """
+        Returns
+        -------
+        dict:{'Player type' : sample variance of duration of games won}
+        The variance is nan for types with fewer than two wins.
+        """
+        return {name: stats[2] / (stats[0] - 1) if stats[0] > 1
+                else float('nan')
+                for name, stats in self._stats.items()}
+
+    def duration_stats(self):
+        """
+        Combines the statistics of all player types.
+        Returns
+        -------
+        tuple: (number of games, mean duration, sample variance)
+        """
+        count, mean, m2 = 0, 0., 0.
+        for type_count, type_mean, type_m2 in self._stats.values():
+            total = count + type_count
+            delta = type_mean - mean
+            mean += delta * type_count / total
+            m2 += type_m2 + delta ** 2 * count * type_count / total
+            count = total
+        variance = m2 / (count - 1) if count > 1 else float('nan')
+        return count, mean, variance
+
+    def duration_histogram_per_type(self):
+        """
+        Returns
+        -------
+        dict:{'Player type' : {num turns: number of games won, ...}, ...}
+        """
+        return {name: dict(histogram)
+                for name, histogram in self._histograms.items()}
+
+
+class ResultStore(Sequence):
+    def __init__(self, capacity=1024):
+        """
+        Compact columnar storage of simulation results. Durations are kept
+        in a uint32 column and winner types as uint8 codes into
+        type_names, about five bytes per game.
+        The store behaves as a read-only list of
+        (turns, winning player type) tuples, built lazily on access.
+        Parameters
+        ----------
+        capacity: int (initial number of games with room reserved)
+        """
+        self._turns = np.empty(capacity, dtype=np.uint32)
+        self._codes = np.empty(capacity, dtype=np.uint8)
+        self._size = 0
+        self.type_names = []
+        self._type_codes = {}
+
+    def _code(self, player_type):
+        """Returns the code of player_type, adding it if it is new."""
+        if player_type not in self._type_codes:
+            if len(self.type_names) > np.iinfo(np.uint8).max:
+                raise ValueError('ResultStore holds at most 256 player '
+                                 'types')
+            self._type_codes[player_type] = len(self.type_names)
+            self.type_names.append(player_type)
+        return self._type_codes[player_type]
+
+    def _reserve(self, extra):
+        """Grows the columns so that extra more games fit."""
+        needed = self._size + extra
+        if needed <= len(self._turns):
+            return
+        capacity = max(needed, 2 * len(self._turns))
+        for column in ('_turns', '_codes'):
+            old = getattr(self, column)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, column, new)
+
+    def append(self, result):
+        """
+        Adds one game.
+        Parameters
+        ----------
+        result: tuple (turns, winning player type)
+        """
+        self._reserve(1)
+        self._turns[self._size] = result[0]
+        self._codes[self._size] = self._code(result[1])
+        self._size += 1
+
+    def extend(self, results):
+        """
+        Adds several games.
+        Parameters
+        ----------
+        results: iterable of (turns, winning player type) tuples
+        """
+        for result in results:
+            self.append(result)
+
+    def add_batch(self, turns, winner, names):
+        """
+        Adds games given as arrays, as produced by the batch engine.
+        Parameters
+        ----------
+        turns: np.ndarray (durations)
+        winner: np.ndarray (index into names of the winner of each game)
+        names: list (player type of each index)
+        """
+        codes = np.array([self._code(name) for name in names],
+                         dtype=np.uint8)
+        count = len(turns)
+        self._reserve(count)
+        self._turns[self._size:self._size + count] = turns
+        self._codes[self._size:self._size + count] = codes[winner]
+        self._size += count
+
+    def to_numpy(self):
+        """
+        Returns the columns as NumPy arrays without copying. The arrays
+        are views and stay valid when games are added, but do not show
+        the new games.
+        Returns
+        -------
+        tuple: (np.ndarray of turns, np.ndarray of winner type codes),
+        codes index type_names
+        """
+        return self._turns[:self._size], self._codes[:self._size]
+
+    def winners_per_type(self):
+        """
+        Returns
+        -------
+        dict:{'Player type' : number of wins, ......}
+        """
+        counts = np.bincount(self._codes[:self._size],
+                             minlength=len(self.type_names))
+        return {name: int(count) for name, count
+                in zip(self.type_names, counts) if count}
+
+    def durations_per_type(self):
+        """
+        Groups the durations by winner type with a stable sort on the
+        type codes, keeping the order of the games within each type.
+        Returns
+        -------
+        dict: {'Player type': np.ndarray of num turns of games won}
+        """
+        turns, codes = self.to_numpy()
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes,
+                                       minlength=len(self.type_names)))
+        groups = np.split(turns[order], bounds[:-1])
+        return {name: group for name, group
+                in zip(self.type_names, groups) if group.size}
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('ResultStore index out of range')
+        return (int(self._turns[index]),
+                self.type_names[self._codes[index]])
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
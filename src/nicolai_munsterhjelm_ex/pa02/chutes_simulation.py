@@ -3,8 +3,65 @@
 __author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
 __email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
 
+import math
 import random
+import time
+from bisect import bisect_left
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from statistics import NormalDist
+from types import MappingProxyType
+
+import numpy as np
+
+from chutes_checkpoint import CheckpointFile
+import chutes_kernel
+from chutes_dice import DICE, NumpyDice, ReplayDice, StdlibDice
+from chutes_profile import MoveProfiler
+from chutes_results import ResultAggregator, ResultStore
+
+
+class _TableDict(dict):
+    """
+    Dict of ladders or chutes that calls on_change, the build_table
+    method of its board, after every change, so that the transition
+    table never goes stale. Changes of a single key pass that key on,
+    so only its square is rebuilt.
+    """
+
+    def __init__(self, pairs, on_change):
+        super().__init__(pairs)
+        self._on_change = on_change
+
+    def __reduce__(self):
+        return self.__class__, (dict(self), self._on_change)
+
+    def _changed(method):
+        def changing(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self._on_change()
+            return result
+        changing.__name__ = method.__name__
+        return changing
+
+    def _key_changed(method):
+        def changing(self, key, *args):
+            result = method(self, key, *args)
+            self._on_change([key])
+            return result
+        changing.__name__ = method.__name__
+        return changing
+
+    __setitem__ = _key_changed(dict.__setitem__)
+    __delitem__ = _key_changed(dict.__delitem__)
+    __ior__ = _changed(dict.__ior__)
+    clear = _changed(dict.clear)
+    pop = _key_changed(dict.pop)
+    popitem = _changed(dict.popitem)
+    setdefault = _changed(dict.setdefault)
+    update = _changed(dict.update)
+    del _changed, _key_changed
 
 
 class Board:
@@ -24,14 +81,110 @@ class Board:
             chutes = [(24, 5), (33, 3), (42, 30), (56, 37), (64, 27),
                       (74, 12), (87, 70)]
 
-        self.ladders = dict(ladders)
-        self.chutes = dict(chutes)
-        self.goal = goal
+        self._ladders = _TableDict(ladders, self.build_table)
+        self._chutes = _TableDict(chutes, self.build_table)
+        self._goal = goal
+        self._squares = []
+        self.table_version = 0
+        self.build_table()
+
+    @property
+    def ladders(self):
+        """dict: {ladder start: ladder end}"""
+        return self._ladders
+
+    @ladders.setter
+    def ladders(self, ladders):
+        self._ladders = _TableDict(ladders, self.build_table)
+        self.build_table()
+
+    @property
+    def chutes(self):
+        """dict: {chute start: chute end}"""
+        return self._chutes
+
+    @chutes.setter
+    def chutes(self, chutes):
+        self._chutes = _TableDict(chutes, self.build_table)
+        self.build_table()
+
+    @property
+    def goal(self):
+        """int: first square that counts as reaching the goal"""
+        return self._goal
+
+    @goal.setter
+    def goal(self, goal):
+        self._goal = goal
+        self.build_table()
+
+    def build_table(self, positions=None):
+        """
+        Builds the transition table mapping every square from 0 to goal+6
+        to the square a player ends up on after chutes and ladders.
+        Called automatically when ladders, chutes or goal are replaced,
+        and when the ladders or chutes dicts are changed in place.
+        The table is stored both as a NumPy array (table), for vectorized
+        engines, and as a list, for fast lookup from Python. The list is
+        updated in place, so players holding a reference to it stay up to
+        date. table_version is increased on every change, so that tables
+        derived from the board can tell when they are stale.
+        Parameters
+        ----------
+        positions: list of int (rebuild only these squares, default all)
+        """
+        self.table_version += 1
+        if positions is None:
+            squares = [position + self._dict_adjustment(position)
+                       for position in range(self._goal + 7)]
+            self._squares[:] = squares
+            self.table = np.array(squares, dtype=np.int64)
+            return
+        for position in positions:
+            if 0 <= position < len(self._squares):
+                end = position + self._dict_adjustment(position)
+                self._squares[position] = end
+                self.table[position] = end
+
+    def save_table(self, path):
+        """
+        Writes the transition table as int32 to a .npy file, which can be
+        loaded with MappedBoard(path).
+        Parameters
+        ----------
+        path: str
+        """
+        np.save(path, self.table.astype(np.int32))
 
     def goal_reached(self, position):
         """Returns True if position is greater or equal to 90.
         """
-        return position >= self.goal
+        return position >= self._goal
+
+    def _dict_adjustment(self, position):
+        """Looks up the adjustment of position in the ladders and chutes
+        dicts."""
+        if position in self._ladders:
+            return self._ladders[position] - position
+        elif position in self._chutes:
+            return self._chutes[position] - position
+        return 0
+
+    def final_position(self, position):
+        """
+        Returns the square a player on position ends up on after
+        chutes and ladders.
+        Parameters
+        ----------
+        position: int
+
+        Returns
+        -------
+        int: Final square
+        """
+        if position < len(self._squares):
+            return self._squares[position]
+        return position + self._dict_adjustment(position)
 
     def position_adjustment(self, position):
         """
@@ -45,38 +198,266 @@ class Board:
         int: Number of moves to adjust according to chutes and ladders list.
         If it isn't at the start of a chute or ladder it returns zero
         """
-        if position in self.ladders.keys():
-            return self.ladders[position] - position
-        elif position in self.chutes.keys():
-            return self.chutes[position] - position
-        return 0
+        return self.final_position(position) - position
+
+    def _move_targets(self, extra_steps, dropped_steps, lazy):
+        """
+        Builds the one-move transitions of a player as index arrays.
+        A player state is (flag, square) for squares below the goal, where
+        flag is chute_last for resilient and ladder_last for lazy players.
+        State flag * goal + square is numbered as an index, and index
+        2 * goal means the goal is reached.
+        Returns
+        -------
+        np.ndarray: shape (2 * goal, 6), target state for each state and
+        roll
+        """
+        goal = self._goal
+        squares = np.arange(goal)
+        rolls = np.arange(1, 7)
+        last_square = len(self.table) - 1
+        targets = []
+        for flag in (False, True):
+            if flag and lazy:
+                intermediate = np.maximum(
+                    squares[:, None] + rolls - dropped_steps,
+                    squares[:, None])
+            elif flag:
+                intermediate = squares[:, None] + rolls + extra_steps
+            else:
+                intermediate = squares[:, None] + rolls
+            end = np.where(
+                intermediate > last_square, intermediate,
+                self.table[np.minimum(intermediate, last_square)])
+            if lazy:
+                new_flag = flag | (end > intermediate)
+            elif extra_steps:
+                new_flag = end < intermediate
+            else:
+                new_flag = np.zeros_like(end, dtype=bool)
+            targets.append(np.where(end >= goal, 2 * goal,
+                                    new_flag * goal + end))
+        return np.concatenate(targets)
+
+    def duration_distribution(self, max_turns, extra_steps=0,
+                              dropped_steps=0, lazy=False):
+        """
+        Computes the exact distribution of the number of turns a single
+        player needs to reach the goal, by propagating the probabilities
+        of the absorbing Markov chain of the board turn by turn.
+        Defaults describe a Player. Use extra_steps for a ResilientPlayer
+        and lazy=True with dropped_steps for a LazyPlayer.
+        Parameters
+        ----------
+        max_turns: int (last turn to compute)
+        extra_steps: int
+        dropped_steps: int
+        lazy: bool
+
+        Returns
+        -------
+        np.ndarray: Element t is the probability of reaching the goal in
+        turn t, for t = 0, ..., max_turns. The missing mass is the
+        probability of needing more than max_turns turns.
+        """
+        goal = self._goal
+        targets = self._move_targets(extra_steps, abs(dropped_steps),
+                                     lazy).ravel()
+        state = np.zeros(2 * goal)
+        state[0] = 1.
+        distribution = np.zeros(max_turns + 1)
+        for turn in range(1, max_turns + 1):
+            new_state = np.bincount(targets, weights=np.repeat(state, 6) / 6,
+                                    minlength=2 * goal + 1)
+            distribution[turn] = new_state[-1]
+            state = new_state[:-1]
+        return distribution
+
+    def remaining_cdfs(self, states, extra_steps=0, dropped_steps=0,
+                       lazy=False, tolerance=1e-12, max_turns=100000):
+        """
+        Computes the distribution functions of the number of turns left
+        until the goal is reached, for players starting in states.
+        Uses the backward recursion P(T_s <= t) = mean over rolls of
+        P(T_target <= t - 1), which updates all states at once.
+        Parameters
+        ----------
+        states: list of int (states numbered as flag * goal + square)
+        extra_steps: int
+        dropped_steps: int
+        lazy: bool
+        tolerance: float (stop when less mass than this is left)
+        max_turns: int (stop after this many turns anyway)
+
+        Returns
+        -------
+        list: one list per state, element t is the probability of
+        reaching the goal in at most t turns
+        """
+        goal = self._goal
+        targets = self._move_targets(extra_steps, abs(dropped_steps), lazy)
+        states = np.asarray(states)
+        reached = np.zeros(2 * goal + 1)
+        reached[-1] = 1.
+        cdfs = [reached[states]]
+        while cdfs[-1].min() < 1 - tolerance and len(cdfs) <= max_turns:
+            reached[:-1] = reached[targets].mean(axis=1)
+            cdfs.append(reached[states])
+        return np.array(cdfs).T.tolist()
+
+
+class MappedBoard(Board):
+    def __init__(self, path):
+        """
+        Board for very large goals, backed only by an int32 transition
+        table in a .npy file that is memory-mapped read-only. Loading is
+        instant, and processes mapping the same file share its pages
+        instead of each holding a copy. A MappedBoard is pickled as its
+        path, so boards sent to worker processes are mapped again there
+        rather than copied.
+        Create the file with MappedBoard.create or Board.save_table.
+        The board cannot be changed, and ladders and chutes are read out
+        of the table when asked for.
+        Parameters
+        ----------
+        path: str (path of the .npy table file)
+        """
+        self.path = path
+        self.table = np.load(path, mmap_mode='r')
+        if self.table.dtype != np.int32 or self.table.ndim != 1:
+            raise ValueError(f'{path} does not hold an int32 table')
+        self._goal = len(self.table) - 7
+        self.table_version = 0
+        # A memoryview indexes to Python ints without copying the table.
+        self._squares = memoryview(self.table)
+
+    @classmethod
+    def create(cls, path, ladders=(), chutes=(), goal=90):
+        """
+        Writes the table of a board to path and maps it. The table is
+        filled with array operations, without building dicts, so boards
+        with millions of chutes and ladders can be generated.
+        Parameters
+        ----------
+        path: str
+        ladders: array-like of (start, end) pairs
+        chutes: array-like of (start, end) pairs
+        goal: int
+
+        Returns
+        -------
+        MappedBoard
+        """
+        if goal + 7 > np.iinfo(np.int32).max:
+            raise ValueError('goal is too large for an int32 table')
+        table = np.lib.format.open_memmap(path, mode='w+', dtype=np.int32,
+                                          shape=(goal + 7,))
+        table[:] = np.arange(goal + 7, dtype=np.int32)
+        for pairs in (chutes, ladders):
+            pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+            table[pairs[:, 0]] = pairs[:, 1]
+        table.flush()
+        del table
+        return cls(path)
+
+    def __reduce__(self):
+        return self.__class__, (self.path,)
+
+    def _pairs(self, moved):
+        """Returns {start: end} for the squares where moved(start, end)."""
+        squares = np.arange(len(self.table))
+        starts = np.flatnonzero(moved(squares, self.table))
+        return MappingProxyType(dict(zip(starts.tolist(),
+                                         self.table[starts].tolist())))
+
+    @property
+    def ladders(self):
+        """mapping: {ladder start: ladder end}, read-only, read from the
+        table"""
+        return self._pairs(np.less)
+
+    @property
+    def chutes(self):
+        """mapping: {chute start: chute end}, read-only, read from the
+        table"""
+        return self._pairs(np.greater)
+
+    @property
+    def goal(self):
+        """int: first square that counts as reaching the goal"""
+        return self._goal
+
+    def build_table(self, positions=None):
+        raise TypeError('MappedBoard cannot be changed')
+
+    def final_position(self, position):
+        """
+        Returns the square a player on position ends up on. Squares past
+        the table have no chutes or ladders.
+        """
+        if position < len(self._squares):
+            return self._squares[position]
+        return position
 
 
 class Player:
+    __slots__ = ('board_instance', 'position', 'turns',
+                 '_squares', '_final_position', '_roll')
+
     def __init__(self, board_instance):
         """
         Creates a player constrained to a board instance.
+        The transition table of the board and the dice method are cached
+        on the player, and reset() puts it back on the start square, so
+        one player can be reused for many games.
         Parameters
         ----------
         board_instance: class instance of Board
         """
         self.board_instance = board_instance
+        self._squares = board_instance._squares
+        self._final_position = board_instance.final_position
+        self._roll = partial(random.randint, 1, 6)
+        self.reset()
+
+    def set_dice(self, dice):
+        """
+        Makes the player roll with a dice backend from chutes_dice
+        instead of the random module.
+        Parameters
+        ----------
+        dice: object with a roll() method
+        """
+        self._roll = dice.roll
+
+    def reset(self):
+        """Puts the player back at the start of a new game."""
         self.position = 0
         self.turns = 0
 
+    def _land(self, position):
+        """Returns the final square when landing on position."""
+        if position < len(self._squares):
+            return self._squares[position]
+        return self._final_position(position)
+
     def move(self):
         """
         Handles a dice cast and checks if it lands on a chute or a ladder
         and updates position accordingly.
         """
-        roll = random.randint(1, 6)
-        self.position += roll
-        self.position += \
-            self.board_instance.position_adjustment(self.position)
+        position = self.position + self._roll()
+        squares = self._squares
+        if position < len(squares):
+            self.position = squares[position]
+        else:
+            self.position = self._final_position(position)
         self.turns += 1
 
 
 class ResilientPlayer(Player):
+    __slots__ = ('extra_steps', 'chute_last')
+
     def __init__(self, board_instance, extra_steps=None):
         """
         Subclass of Player. takes extra steps next move
@@ -89,28 +470,31 @@ class ResilientPlayer(Player):
         if extra_steps is None:
             extra_steps = 1
         self.extra_steps = extra_steps
-        self.chute_last = False
         super().__init__(board_instance)
 
+    def reset(self):
+        """Puts the player back at the start of a new game."""
+        super().reset()
+        self.chute_last = False
+
     def move(self):
         """
         Modified version of move from superclass Player.
         Handles the extra steps and updates position accordingly.
         """
-        roll = random.randint(1, 6)
-        self.position += roll
+        pre_adjust = self.position + self._roll()
         if self.chute_last:
-            self.position += self.extra_steps
+            pre_adjust += self.extra_steps
             self.chute_last = False
-        pre_adjust = self.position
-        self.position += \
-            self.board_instance.position_adjustment(self.position)
+        self.position = self._land(pre_adjust)
         if pre_adjust > self.position:
             self.chute_last = True
         self.turns += 1
 
 
 class LazyPlayer(Player):
+    __slots__ = ('dropped_steps', 'ladder_last')
+
     def __init__(self, board_instance, dropped_steps=None):
         """
         Subclass of Player. Drop steps next move
@@ -124,9 +508,13 @@ class LazyPlayer(Player):
         if dropped_steps is None:
             dropped_steps = 1
         self.dropped_steps = abs(dropped_steps)
-        self.ladder_last = False
         super().__init__(board_instance)
 
+    def reset(self):
+        """Puts the player back at the start of a new game."""
+        super().reset()
+        self.ladder_last = False
+
     def move(self):
         """
         Modified version of move from superclass Player.
@@ -135,7 +523,7 @@ class LazyPlayer(Player):
         -------
 
         """
-        roll = random.randint(1, 6)
+        roll = self._roll()
         start_position = self.position
 
         if self.ladder_last:
@@ -145,8 +533,7 @@ class LazyPlayer(Player):
         else:
             intermediate_position = start_position + roll
 
-        self.position = intermediate_position + \
-            self.board_instance.position_adjustment(intermediate_position)
+        self.position = self._land(intermediate_position)
 
         if self.position > intermediate_position:
             self.ladder_last = True
@@ -154,10 +541,63 @@ class LazyPlayer(Player):
         self.turns += 1
 
 
+def paired_win_rate_difference(results_a, results_b, slot=0):
+    """
+    Estimates how much more often a player slot wins with one field than
+    with another, from games played with common random numbers.
+    Parameters
+    ----------
+    results_a: list of (turns, winner type, winning slot), field a
+    results_b: list of (turns, winner type, winning slot), field b
+    slot: int (player slot to compare)
+
+    Returns
+    -------
+    tuple: (win rate in a minus win rate in b, standard error)
+    """
+    differences = np.array([(a[2] == slot) - (b[2] == slot)
+                            for a, b in zip(results_a, results_b)])
+    return (differences.mean(),
+            differences.std(ddof=1) / np.sqrt(len(differences)))
+
+
+def _chunk_seed(seed_sequence):
+    """Turns a SeedSequence into an int seed usable by both random.seed
+    and np.random.default_rng."""
+    return int.from_bytes(seed_sequence.generate_state(4).tobytes(),
+                          'little')
+
+
+def _simulate_chunk(player_field, board, seed, num_games, engine,
+                    dice_class, tail_table):
+    """
+    Plays one chunk of a sharded simulation. Module level so that it can
+    be sent to worker processes.
+    Returns
+    -------
+    list: [(turns, winning player type), .....]
+    """
+    sim = Simulation(player_field, board, seed, dice=dice_class,
+                     tail_table=tail_table)
+    if engine == 'batch':
+        sim.run_batch_simulation(num_games)
+    elif dice_class is not None:
+        sim.run_simulation(num_games)
+    else:
+        state = random.getstate()
+        random.seed(seed)
+        try:
+            sim.run_simulation(num_games)
+        finally:
+            random.setstate(state)
+    return sim.winning_list
+
+
 class Simulation:
     def __init__(
             self, player_field, board=None,
-            seed=None, randomize_players=False
+            seed=None, randomize_players=False, keep_results=True,
+            compact_results=False, dice=None, tail_table=0
     ):
         """
         Handles the simulation part of the task.
@@ -167,6 +607,18 @@ class Simulation:
         board: Class instance of Board
         seed: int (sets the seed of random functions)
         randomize_players: bool (choose if players should be shuffled)
+        keep_results: bool (store every game in winning_list, if False
+        only the running statistics in aggregator are kept)
+        compact_results: bool (store winning_list as a columnar
+        ResultStore instead of a list of tuples)
+        dice: dice backend for the players, either a name from
+        chutes_dice.DICE ('stdlib', 'numpy', 'lcg'), a backend class, which
+        is seeded with seed, or a backend instance. The default None rolls
+        with the random module.
+        tail_table: int (number of squares before the goal on which
+        players are finished in one step, 0 switches this off and 6
+        covers the squares within one roll of the goal, see single_game,
+        only for Player, ResilientPlayer and LazyPlayer)
         """
         if board is None:
             board = Board()
@@ -175,24 +627,251 @@ class Simulation:
         self.seed = seed
         if randomize_players:
             random.shuffle(self.player_field)
-        self.winning_list = []
+        self.keep_results = keep_results
+        self.winning_list = ResultStore() if compact_results else []
+        self.aggregator = ResultAggregator()
+        self._players = []
+        self._players_board = None
+        self._players_field = None
+        if isinstance(dice, str):
+            dice = DICE[dice]
+        if isinstance(dice, type):
+            dice = dice(seed)
+        self.dice = dice
+        self.tail_table = tail_table
+        # The tail draws get their own stream, so that they are not
+        # correlated with dice seeded with the same seed. Unseeded
+        # simulations draw it from OS entropy like their dice.
+        if dice is None:
+            self._tail_random = None
+        elif seed is None:
+            self._tail_random = random.Random()
+        else:
+            self._tail_random = random.Random(f'tail table {seed}')
+        self._tail_uniform = random.random if dice is None \
+            else self._tail_random.random
+        self._tail_tables = None
+        self.profiler = None
+        self._np_rng = np.random.default_rng(seed)
+        self._seed_sequence = np.random.SeedSequence(seed)
 
     def single_game(self):
         """
         Plays a single game
+        With tail_table set, a player that lands within tail_table squares
+        of the goal does not move any more. Instead, the number of turns it
+        still needs is drawn at once from the exact distribution for its
+        square and state (see _tail_game). This gives the same distribution
+        of results with fewer moves, but a tail draw costs more than a
+        move, so it only saves time when the tail covers much of the
+        board. On the default board tail_table=6 is slightly slower than
+        playing every move, and tail_table=89 about four times faster.
+        With profiling enabled the game is played by the profiler instead,
+        see enable_profiling.
         Returns
         -------
         Tuple : (turns , winning player type)
         """
+        if self.profiler is not None:
+            self._check_profiling()
+            return self.profiler.play_game(self.player_field, self.dice)
+        if self.tail_table:
+            return self._tail_game()
 
-        players = [cl(self.board) for cl in self.player_field]
+        players = self._reusable_players()
+        for player in players:
+            player.reset()
+        goal_reached = self.board.goal_reached
 
         while True:
             for player in players:
                 player.move()
-                if self.board.goal_reached(player.position):
+                if goal_reached(player.position):
                     return player.turns, player.__class__.__name__
 
+    def enable_profiling(self, sample_every=100):
+        """
+        Plays the following games with instrumented players that count
+        chute and ladder hits and moves per game and time a sample of the
+        moves (see chutes_profile.MoveProfiler). Without profiling the game
+        loop has no instrumentation at all.
+        The profiler plays every move, so it cannot be combined with
+        tail_table, and it counts hits on the board of the simulation at
+        the time profiling is enabled. Both raise ValueError.
+        Parameters
+        ----------
+        sample_every: int (time one move out of this many)
+
+        Returns
+        -------
+        MoveProfiler: collects the counts, see its report() and heatmap()
+        """
+        self.profiler = MoveProfiler(self.board, sample_every)
+        self._check_profiling()
+        return self.profiler
+
+    def _check_profiling(self):
+        """Raises ValueError if the profiler would not play the games of
+        this simulation."""
+        if self.tail_table:
+            raise ValueError('profiling cannot be combined with tail_table')
+        if self.profiler.board is not self.board:
+            raise ValueError('the board was replaced after profiling was '
+                             'enabled, call enable_profiling again')
+
+    def disable_profiling(self):
+        """Goes back to the uninstrumented game loop."""
+        self.profiler = None
+
+    def _build_tail_tables(self, players):
+        """
+        Builds, for every player, the distribution functions of the turns
+        left from each square within tail_table of the goal, with the chute
+        or ladder flag off and on. Element 1 of a distribution is the one-roll
+        win probability. Players with equal parameters share tables.
+        Returns
+        -------
+        list: per player, (flag attribute name or None, list of cdfs
+        indexed by 2 * (square - first tail square) + flag)
+        """
+        goal = self.board.goal
+        tail = range(max(goal - self.tail_table, 0), goal)
+        states = [flag * goal + square
+                  for square in tail for flag in (0, 1)]
+        names, extra, dropped, lazy = self._field_parameters()
+        cache = {}
+        tables = []
+        for slot, player in enumerate(players):
+            key = (int(extra[slot]), int(dropped[slot]), bool(lazy[slot]))
+            if key not in cache:
+                cache[key] = self.board.remaining_cdfs(
+                    states, key[0], key[1], key[2])
+            if lazy[slot]:
+                flag_attribute = 'ladder_last'
+            elif extra[slot]:
+                flag_attribute = 'chute_last'
+            else:
+                flag_attribute = None
+            tables.append((flag_attribute, cache[key]))
+        return tables
+
+    def _tail_game(self):
+        """
+        Plays a single game, finishing players near the goal in one step.
+        Players move independently of each other, so a player that will
+        reach the goal in turn t wins if no player before it reaches the
+        goal in turn t or earlier and no player after it in turn t - 1 or
+        earlier. The sampled finishing turn is kept and the player waits
+        for its slot in that round. If the drawn number is beyond the
+        computed distribution (probability below 1e-12) the player keeps
+        moving normally.
+        Returns
+        -------
+        Tuple : (turns , winning player type)
+        """
+        players = self._reusable_players()
+        # The tables go stale when the players, the board or its table
+        # change, or when tail_table is set to another width.
+        key = (players, self.board, self.board.table_version,
+               self.board.goal, self.tail_table)
+        if self._tail_tables is None or self._tail_tables[0] != key:
+            self._tail_tables = (key, self._build_tail_tables(players))
+        tables = self._tail_tables[1]
+        for player in players:
+            player.reset()
+        goal = self.board.goal
+        tail_start = max(goal - self.tail_table, 0)
+        uniform = self._tail_uniform
+        finish = [0] * len(players)
+
+        round_num = 0
+        while True:
+            round_num += 1
+            for slot, player in enumerate(players):
+                if finish[slot]:
+                    if finish[slot] == round_num:
+                        return round_num, player.__class__.__name__
+                    continue
+                player.move()
+                position = player.position
+                if position >= goal:
+                    return player.turns, player.__class__.__name__
+                if position >= tail_start:
+                    flag_attribute, cdfs = tables[slot]
+                    flag = flag_attribute is not None \
+                        and getattr(player, flag_attribute)
+                    cdf = cdfs[2 * (position - tail_start) + flag]
+                    draw = uniform()
+                    if draw <= cdf[-1]:
+                        finish[slot] = round_num + max(
+                            bisect_left(cdf, draw), 1)
+
+    def run_common_random_numbers(self, fields, num_games):
+        """
+        Plays every game once with each player field in fields, replaying
+        the same dice. Each player slot has its own dice stream, so slot i
+        gets the same rolls whatever strategy it plays. Differences between
+        fields are then estimated from paired games, with much smaller
+        variance than from independent runs (see
+        paired_win_rate_difference). The dice are of the class of the
+        simulation dice, StdlibDice by default, seeded from seed.
+        Parameters
+        ----------
+        fields: list of player fields (lists of player types)
+        num_games: int (number of games per field)
+
+        Returns
+        -------
+        list: per field, list of (turns, winning player type, winning slot)
+        """
+        dice_class = StdlibDice if self.dice is None else type(self.dice)
+        num_slots = max(len(field) for field in fields)
+        dice = [ReplayDice(dice_class(_chunk_seed(child)))
+                for child in self._seed_sequence.spawn(num_slots)]
+        field_players = []
+        for field in fields:
+            players = [cl(self.board) for cl in field]
+            for player, slot_dice in zip(players, dice):
+                player.set_dice(slot_dice)
+            field_players.append(players)
+
+        results = [[] for _ in fields]
+        goal_reached = self.board.goal_reached
+        for game in range(num_games):
+            for players, field_results in zip(field_players, results):
+                for player in players:
+                    player.reset()
+                for slot_dice in dice:
+                    slot_dice.rewind()
+                won = False
+                while not won:
+                    for slot, player in enumerate(players):
+                        player.move()
+                        if goal_reached(player.position):
+                            field_results.append(
+                                (player.turns, player.__class__.__name__,
+                                 slot))
+                            won = True
+                            break
+            for slot_dice in dice:
+                slot_dice.next_game()
+        return results
+
+    def _reusable_players(self):
+        """
+        Returns the players of the field, creating them only when the
+        board or the player field has changed since the last game.
+        """
+        if (self._players_board is not self.board
+                or self._players_field != self.player_field):
+            self._players = [cl(self.board) for cl in self.player_field]
+            if self.dice is not None:
+                for player in self._players:
+                    player.set_dice(self.dice)
+            self._players_board = self.board
+            self._players_field = list(self.player_field)
+        return self._players
+
     def run_simulation(self, num_games):
         """
         Runs simulation for given number of games
@@ -203,8 +882,447 @@ class Simulation:
         num_games : Number of games to be simulated
         """
 
+        add = self.aggregator.add
         for game in range(num_games):
-            self.winning_list.append(self.single_game())
+            result = self.single_game()
+            add(*result)
+            if self.keep_results:
+                self.winning_list.append(result)
+
+    def _record_results(self, results):
+        """Stores a list of (turns, winning player type) results."""
+        add = self.aggregator.add
+        for result in results:
+            add(*result)
+        if self.keep_results:
+            self.winning_list.extend(results)
+
+    def _record_batch(self, turns, winner, names):
+        """Stores the results of a batch given as arrays of turns and
+        winning slots."""
+        for slot, name in enumerate(names):
+            self.aggregator.add_many(turns[winner == slot], name)
+        if not self.keep_results:
+            return
+        if isinstance(self.winning_list, ResultStore):
+            self.winning_list.add_batch(turns, winner, names)
+        else:
+            self.winning_list.extend(
+                zip(turns.tolist(), [names[slot] for slot in winner]))
+
+    def _field_parameters(self):
+        """
+        Builds one player of each slot in the field and reads out the
+        parameters needed by the batch engine.
+        Returns
+        -------
+        tuple: (names, extra, dropped, lazy), one entry per player slot
+
+        Raises
+        ------
+        ValueError
+            If a player is of another class than Player, ResilientPlayer
+            or LazyPlayer, whose move rules the engines cannot know.
+        """
+        players = [cl(self.board) for cl in self.player_field]
+        for player in players:
+            if type(player) not in (Player, ResilientPlayer, LazyPlayer):
+                raise ValueError(f'{player.__class__.__name__} is not '
+                                 f'supported, only Player, ResilientPlayer '
+                                 f'and LazyPlayer are')
+        names = [player.__class__.__name__ for player in players]
+        extra = np.array([getattr(player, 'extra_steps', 0)
+                          for player in players], dtype=np.int64)
+        dropped = np.array([getattr(player, 'dropped_steps', 0)
+                            for player in players], dtype=np.int64)
+        lazy = np.array([hasattr(player, 'ladder_last')
+                         for player in players], dtype=bool)
+        return names, extra, dropped, lazy
+
+    def _play_batch(self, num_games, table, extra, dropped, lazy):
+        """
+        Plays num_games games simultaneously.
+        Every round, each player slot moves in turn in all games that are
+        still running. Games are retired as soon as a player reaches the
+        goal, so later players in the same round do not move.
+        Parameters
+        ----------
+        num_games: int
+        table: np.ndarray (transition table of the board)
+        extra: np.ndarray (extra steps per slot, 0 if not resilient)
+        dropped: np.ndarray (dropped steps per slot)
+        lazy: np.ndarray (True for lazy slots)
+
+        Returns
+        -------
+        tuple: (np.ndarray of turns, np.ndarray of winning slot)
+        """
+        num_players = len(extra)
+        # Squares beyond the table are past the goal, so clipping the
+        # index only changes positions of games that are already won.
+        last_square = len(table) - 1
+        goal = self.board.goal
+
+        position = np.zeros((num_games, num_players), dtype=np.int64)
+        flag = np.zeros((num_games, num_players), dtype=bool)
+        turns = np.zeros(num_games, dtype=np.int64)
+        winner = np.zeros(num_games, dtype=np.int64)
+        active = np.arange(num_games)
+
+        round_num = 0
+        while active.size > 0:
+            round_num += 1
+            rolls = self._np_rng.integers(1, 7, size=(active.size,
+                                                      num_players))
+            for slot in range(num_players):
+                start = position[active, slot]
+                slot_flag = flag[active, slot]
+                step = rolls[:, slot]
+                if lazy[slot]:
+                    step = np.where(slot_flag,
+                                    np.maximum(step - dropped[slot], 0),
+                                    step)
+                elif extra[slot]:
+                    step = step + np.where(slot_flag, extra[slot], 0)
+                intermediate = start + step
+                end = table[np.minimum(intermediate, last_square)]
+
+                if lazy[slot]:
+                    flag[active, slot] = slot_flag | (end > intermediate)
+                elif extra[slot]:
+                    flag[active, slot] = end < intermediate
+                position[active, slot] = end
+
+                won = end >= goal
+                if won.any():
+                    finished = active[won]
+                    turns[finished] = round_num
+                    winner[finished] = slot
+                    active = active[~won]
+                    rolls = rolls[~won]
+
+        return turns, winner
+
+    def run_batch_simulation(self, num_games, batch_size=10000):
+        """
+        Vectorized alternative to run_simulation. Plays games in batches
+        of batch_size as NumPy arrays and stores the results in
+        winning_list in the same format as run_simulation.
+        The dice are drawn from a NumPy generator seeded with seed, so
+        results are statistically, not move by move, equal to
+        run_simulation.
+        Parameters
+        ----------
+        num_games: int (number of games to be simulated)
+        batch_size: int (number of games played simultaneously)
+        """
+        names, extra, dropped, lazy = self._field_parameters()
+        table = self.board.table
+
+        remaining = num_games
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            turns, winner = self._play_batch(size, table,
+                                             extra, dropped, lazy)
+            self._record_batch(turns, winner, names)
+            remaining -= size
+
+    def confidence_intervals(self, metric='win_rate', confidence=0.95):
+        """
+        Estimates a metric from all games played so far, with the half
+        width of its normal-approximation confidence interval.
+        Parameters
+        ----------
+        metric: str ('win_rate' per player type or 'mean_duration' of all
+        games)
+        confidence: float (confidence level of the intervals)
+
+        Returns
+        -------
+        dict: {'Player type' or 'all': (estimate, half width)}
+        """
+        if metric not in ('win_rate', 'mean_duration'):
+            raise ValueError("metric must be 'win_rate' or 'mean_duration'")
+        if self.aggregator.num_games == 0:
+            raise ValueError('no games have been played yet')
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        if metric == 'win_rate':
+            wins = self.aggregator.winners_per_type()
+            num_games = self.aggregator.num_games
+            estimates = {}
+            for player in self.player_field:
+                name = player(self.board).__class__.__name__
+                rate = wins.get(name, 0) / num_games
+                estimates[name] = (
+                    rate, z * math.sqrt(rate * (1 - rate) / num_games))
+            return estimates
+        num_games, mean, variance = self.aggregator.duration_stats()
+        return {'all': (mean, z * math.sqrt(variance / num_games))}
+
+    def run_until(self, precision, metric='win_rate', confidence=0.95,
+                  batch_size=10000, max_games=10**8, engine='batch'):
+        """
+        Plays batches of games until the confidence intervals of metric
+        are narrower than precision on each side, instead of a number of
+        games fixed in advance. Games played earlier with this simulation
+        count towards the estimates.
+        Win rates with no wins yet have zero width, so at least two
+        batches are played.
+        Parameters
+        ----------
+        precision: float (largest allowed half width of the intervals)
+        metric: str ('win_rate' or 'mean_duration', see
+        confidence_intervals)
+        confidence: float (confidence level of the intervals)
+        batch_size: int (games between checks)
+        max_games: int (stop after this many games anyway)
+        engine: str ('batch' or 'python')
+
+        Returns
+        -------
+        dict: {'games': games played by this call,
+               'converged': True if precision was reached,
+               'estimates': {name: (estimate, half width)}}
+        """
+        games = 0
+        while True:
+            size = min(batch_size, max_games - games)
+            if engine == 'batch':
+                self.run_batch_simulation(size)
+            else:
+                self.run_simulation(size)
+            games += size
+            estimates = self.confidence_intervals(metric, confidence)
+            converged = games > batch_size and all(
+                half_width <= precision
+                for _, half_width in estimates.values())
+            if converged or games >= max_games:
+                return {'games': games, 'converged': converged,
+                        'estimates': estimates}
+
+    def run_kernel_simulation(self, num_games):
+        """
+        Runs the simulation with the compiled game loop of chutes_kernel
+        (Numba if installed, plain Python otherwise). The rolls are taken
+        from the dice of the simulation, which must be NumpyDice, in the
+        same order as run_simulation would use them, so both give the same
+        results for the same dice stream. Only the move rules of Player,
+        ResilientPlayer and LazyPlayer are supported.
+        Parameters
+        ----------
+        num_games: int (number of games to be simulated)
+        """
+        if not isinstance(self.dice, NumpyDice):
+            raise ValueError("run_kernel_simulation needs dice='numpy'")
+        names, extra, dropped, lazy = self._field_parameters()
+        turns = np.empty(num_games, dtype=np.int64)
+        winner = np.empty(num_games, dtype=np.int64)
+        chutes_kernel.run_games(self.board.table, self.board.goal, extra,
+                                dropped, lazy, self.dice, num_games,
+                                turns, winner)
+        self._record_batch(turns, winner, names)
+
+    def run_parallel_simulation(self, num_games, workers=None,
+                                chunk_size=10000, engine='python'):
+        """
+        Runs the simulation sharded over worker processes.
+        num_games is split in chunks of chunk_size games, and every chunk
+        gets its own seed spawned from seed. The chunks do not depend on
+        the number of workers, so for a given seed and chunk_size the
+        results are identical for any number of workers. Later calls
+        continue the seed stream. With a dice backend, every chunk uses a
+        new backend of the same class.
+        Parameters
+        ----------
+        num_games: int (number of games to be simulated)
+        workers: int (number of processes, None uses all cores and 1
+        runs the chunks in this process)
+        chunk_size: int (number of games per chunk)
+        engine: str ('python' for single_game, 'batch' for the
+        vectorized engine)
+        """
+        if engine not in ('python', 'batch'):
+            raise ValueError("engine must be 'python' or 'batch'")
+
+        sizes = [min(chunk_size, num_games - start)
+                 for start in range(0, num_games, chunk_size)]
+        seeds = [_chunk_seed(child)
+                 for child in self._seed_sequence.spawn(len(sizes))]
+        dice_class = None if self.dice is None else type(self.dice)
+        args = ([self.player_field] * len(sizes), [self.board] * len(sizes),
+                seeds, sizes, [engine] * len(sizes),
+                [dice_class] * len(sizes), [self.tail_table] * len(sizes))
+
+        if workers == 1:
+            for chunk_results in map(_simulate_chunk, *args):
+                self._record_results(chunk_results)
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                for chunk_results in executor.map(_simulate_chunk, *args):
+                    self._record_results(chunk_results)
+
+    def run_checkpointed(self, num_games, path, interval=5.,
+                         engine='python', batch_size=10000):
+        """
+        Runs the simulation while periodically saving the results and the
+        RNG state to a checkpoint at path (see CheckpointFile). A killed
+        run is continued with Simulation.resume(path), giving the same
+        results as an uninterrupted run.
+        The python engine draws from the dice backend or the random
+        module, the batch engine from the NumPy generator of the
+        simulation.
+        Parameters
+        ----------
+        num_games: int (number of games to be simulated)
+        path: str (path of the checkpoint results file)
+        interval: float (seconds between checkpoints)
+        engine: str ('python' or 'batch')
+        batch_size: int (games per batch for the batch engine)
+        """
+        if engine not in ('python', 'batch'):
+            raise ValueError("engine must be 'python' or 'batch'")
+        state = {'player_field': self.player_field, 'board': self.board,
+                 'seed': self.seed, 'keep_results': self.keep_results,
+                 'compact_results': isinstance(self.winning_list,
+                                               ResultStore),
+                 'tail_table': self.tail_table,
+                 'dice_class': None if self.dice is None
+                 else type(self.dice),
+                 'engine': engine, 'batch_size': batch_size,
+                 'interval': interval, 'num_games': num_games,
+                 'games_done': 0, 'type_names': []}
+        self._save_rng_state(state)
+        checkpoint = CheckpointFile(path)
+        checkpoint.create(state)
+        self._continue_checkpointed(checkpoint, state)
+
+    @classmethod
+    def resume(cls, path):
+        """
+        Continues a run started with run_checkpointed from its last
+        checkpoint. Results written after that checkpoint are discarded
+        and played again from the saved RNG state.
+        Parameters
+        ----------
+        path: str (path of the checkpoint results file)
+
+        Returns
+        -------
+        Simulation: simulation holding the results of the whole run
+        """
+        checkpoint = CheckpointFile(path)
+        state = checkpoint.load_state()
+        sim = cls(state['player_field'], state['board'], state['seed'],
+                  keep_results=state['keep_results'],
+                  compact_results=state['compact_results'],
+                  dice=state['dice_class'],
+                  tail_table=state['tail_table'])
+        checkpoint.truncate(state['games_done'])
+        records = checkpoint.records(state['games_done'])
+        sim._record_batch(records['turns'], records['winner'],
+                          state['type_names'])
+        if 'dice_state' in state:
+            sim.dice.setstate(state['dice_state'])
+            sim._tail_random.setstate(state['tail_state'])
+        elif state['engine'] == 'python':
+            random.setstate(state['random_state'])
+        else:
+            sim._np_rng.bit_generator.state = state['np_rng_state']
+        sim._continue_checkpointed(checkpoint, state)
+        return sim
+
+    def _save_rng_state(self, state):
+        """Stores the state of the RNG used by the engine in state."""
+        if state['engine'] == 'python' and self.dice is not None:
+            state['dice_state'] = self.dice.getstate()
+            state['tail_state'] = self._tail_random.getstate()
+        elif state['engine'] == 'python':
+            state['random_state'] = random.getstate()
+        else:
+            state['np_rng_state'] = self._np_rng.bit_generator.state
+
+    def _continue_checkpointed(self, checkpoint, state):
+        """
+        Plays the games left in a checkpointed run, appending results to
+        the checkpoint every state['interval'] seconds.
+        """
+        type_names = state['type_names']
+        type_codes = {name: code for code, name in enumerate(type_names)}
+
+        def code(name):
+            if name not in type_codes:
+                type_codes[name] = len(type_names)
+                type_names.append(name)
+            return type_codes[name]
+
+        if state['engine'] == 'batch':
+            names, extra, dropped, lazy = self._field_parameters()
+            slot_codes = np.array([code(name) for name in names])
+
+        pending_turns = []
+        pending_codes = []
+        last_save = time.monotonic()
+        while state['games_done'] < state['num_games']:
+            if state['engine'] == 'batch':
+                size = min(state['batch_size'],
+                           state['num_games'] - state['games_done'])
+                turns, winner = self._play_batch(size, self.board.table,
+                                                 extra, dropped, lazy)
+                self._record_batch(turns, winner, names)
+                pending_turns.extend(turns.tolist())
+                pending_codes.extend(slot_codes[winner].tolist())
+            else:
+                size = 1
+                result = self.single_game()
+                self._record_results([result])
+                pending_turns.append(result[0])
+                pending_codes.append(code(result[1]))
+            state['games_done'] += size
+
+            now = time.monotonic()
+            if (now - last_save >= state['interval']
+                    or state['games_done'] == state['num_games']):
+                self._save_rng_state(state)
+                checkpoint.append(pending_turns, pending_codes, state)
+                pending_turns = []
+                pending_codes = []
+                last_save = now
+
+    def exact_durations_per_type(self, max_turns):
+        """
+        Computes the exact joint distribution of winner type and game
+        duration from the Markov chains of the players. Players move
+        independently, so player i wins in round t if it reaches the goal
+        in turn t, players before it have not reached it after t turns and
+        players after it have not reached it after t - 1 turns.
+        Useful as a reference for the Monte Carlo results.
+        Parameters
+        ----------
+        max_turns: int (last turn to compute)
+
+        Returns
+        -------
+        dict: {'Player type': np.ndarray}, element t is the probability
+        that a player of that type wins in turn t. Summing an array gives
+        the win probability of that type.
+        """
+        names, extra, dropped, lazy = self._field_parameters()
+        distributions = [
+            self.board.duration_distribution(max_turns, extra[slot],
+                                             dropped[slot], lazy[slot])
+            for slot in range(len(names))]
+        survival = [1 - np.cumsum(dist) for dist in distributions]
+
+        per_type = {}
+        for slot, name in enumerate(names):
+            win = distributions[slot].copy()
+            for other in range(len(names)):
+                if other < slot:
+                    win *= survival[other]
+                elif other > slot:
+                    win[1:] *= survival[other][:-1]
+            per_type[name] = per_type.get(name, 0) + win
+        return per_type
 
     def get_results(self):
         """
@@ -224,8 +1342,7 @@ class Simulation:
         -------
         dict:{'Player type' : number of wins, ......}
         """
-        
-        return dict(Counter(elem[1] for elem in self.winning_list))
+        return self.aggregator.winners_per_type()
 
     def durations_per_type(self):
         """
@@ -234,7 +1351,19 @@ class Simulation:
         Returns
         -------
         dict: {'Player type': [num turns of games won, .....]}
+
+        Raises
+        ------
+        RuntimeError
+            If the simulation does not keep results. Use
+            aggregator.duration_histogram_per_type instead.
         """
+        if not self.keep_results:
+            raise RuntimeError('Durations of single games are only '
+                               'available with keep_results=True')
+        if isinstance(self.winning_list, ResultStore):
+            return {name: turns.tolist() for name, turns
+                    in self.winning_list.durations_per_type().items()}
         player_turn_count = {}
 
         for winning_tuple in self.winning_list:
@@ -256,5 +1385,5 @@ class Simulation:
         -------
         dict: {'Player type': number of that type participating}
         """
-        return dict(Counter(player.__name__
-                    for player in self.player_field))
+        return dict(Counter(cl(self.board).__class__.__name__
+                            for cl in self.player_field))
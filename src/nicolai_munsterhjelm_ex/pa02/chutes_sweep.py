@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parameter sweeps over chutes_simulation.
+
+A grid maps parameter names to lists of values, and every combination is
+simulated:
+
+    field          tuples of player type names, e.g. ('Player', 'LazyPlayer')
+    num_players    number of players, the field is repeated to this length
+    extra_steps    extra_steps of every ResilientPlayer
+    dropped_steps  dropped_steps of every LazyPlayer
+
+Parameters of player types that are not in the field are set to None, so
+points that differ only in them are simulated once.
+    layout         names of board layouts, None is the default board
+
+Example:
+
+    rows = sweep({'field': [('Player', 'ResilientPlayer')],
+                  'extra_steps': [1, 2, 3]}, num_games=10000,
+                 cache_dir='sweep_cache')
+"""
+
+__author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
+__email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
+
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import chutes_simulation as cs
+
+PLAYER_TYPES = {'Player': cs.Player,
+                'ResilientPlayer': cs.ResilientPlayer,
+                'LazyPlayer': cs.LazyPlayer}
+
+DEFAULTS = {'field': ('Player',), 'num_players': None, 'extra_steps': 1,
+            'dropped_steps': 1, 'layout': None}
+
+PLAYER_PARAMETERS = {'extra_steps': 'ResilientPlayer',
+                     'dropped_steps': 'LazyPlayer'}
+
+
+def grid_points(grid):
+    """
+    Lists all combinations of the parameters in grid.
+    Parameters
+    ----------
+    grid: dict {parameter name: list of values}
+
+    Returns
+    -------
+    list: one dict per distinct point, with defaults for parameters not
+    in grid and None for parameters of player types not in the field
+    """
+    unknown = set(grid) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f'Unknown sweep parameters: {sorted(unknown)}')
+    names = list(DEFAULTS)
+    values = [grid.get(name, [DEFAULTS[name]]) for name in names]
+    points = []
+    for combination in itertools.product(*values):
+        point = dict(zip(names, combination))
+        for parameter, player_type in PLAYER_PARAMETERS.items():
+            if player_type not in point['field']:
+                point[parameter] = None
+        if point not in points:
+            points.append(point)
+    return points
+
+
+def player_field(point):
+    """
+    Builds the player field of a point.
+    Returns
+    -------
+    list: player classes, with extra_steps and dropped_steps bound
+    """
+    types = list(point['field'])
+    if point['num_players'] is not None:
+        types = list(itertools.islice(itertools.cycle(types),
+                                      point['num_players']))
+    parameters = {'ResilientPlayer': {'extra_steps': point['extra_steps']},
+                  'LazyPlayer': {'dropped_steps': point['dropped_steps']}}
+    return [partial(PLAYER_TYPES[name], **parameters.get(name, {}))
+            for name in types]
+
+
+def point_key(point, layout, num_games, seed, engine):
+    """
+    Returns a hash identifying a simulation, including the contents of
+    its board layout, so cached results are not reused if a layout
+    changes.
+    """
+    description = json.dumps([point, layout, num_games, seed, engine],
+                             sort_keys=True, default=list)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def _run_point(point, board, num_games, seed, engine):
+    """
+    Simulates one point. Module level so that it can be sent to worker
+    processes.
+    Returns
+    -------
+    list: one row per player type in the field
+    """
+    sim = cs.Simulation(player_field(point), board, seed, keep_results=False,
+                        dice='numpy')
+    if engine == 'batch':
+        sim.run_batch_simulation(num_games)
+    else:
+        sim.run_simulation(num_games)
+    wins = sim.winners_per_type()
+    means = sim.aggregator.mean_duration_per_type()
+    rows = []
+    for name in dict.fromkeys(point['field']):
+        row = dict(point, field='+'.join(point['field']), player_type=name,
+                   games=num_games, wins=wins.get(name, 0),
+                   win_rate=wins.get(name, 0) / num_games,
+                   mean_duration=means.get(name))
+        rows.append(row)
+    return rows
+
+
+def _store(todo, computed, results, cache_dir):
+    """Collects computed rows in results and writes them to the cache."""
+    for (_, key), rows in zip(todo, computed):
+        results[key] = rows
+        if cache_dir is not None:
+            with open(os.path.join(cache_dir, key + '.json'),
+                      'w') as cache_file:
+                json.dump(rows, cache_file)
+
+
+def sweep(grid, num_games, layouts=None, cache_dir=None, workers=None,
+          seed=0, engine='batch'):
+    """
+    Simulates every point of grid on a process pool.
+    Boards are built once per layout, so their transition tables are
+    computed once and shared by all points using the layout. Every point
+    is seeded from its own hash, so results do not depend on the order in
+    which points are scheduled. With cache_dir, results are stored as
+    JSON files named by the point hash, and points found there are not
+    simulated again.
+    Parameters
+    ----------
+    grid: dict {parameter name: list of values}, see module docstring
+    num_games: int (games per point)
+    layouts: dict {layout name: dict with ladders, chutes and goal}
+    cache_dir: str (directory of the result cache, None for no cache)
+    workers: int (number of processes, 1 runs in this process)
+    seed: int
+    engine: str ('batch' or 'python')
+
+    Returns
+    -------
+    list: tidy table with one dict per point and player type
+    """
+    layouts = {} if layouts is None else layouts
+    boards = {None: cs.Board()}
+    for name, layout in layouts.items():
+        boards[name] = cs.Board(**layout)
+
+    points = grid_points(grid)
+    keys = [point_key(point, layouts.get(point['layout']), num_games, seed,
+                      engine)
+            for point in points]
+    results = {}
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for key in keys:
+            path = os.path.join(cache_dir, key + '.json')
+            if os.path.exists(path):
+                with open(path) as cache_file:
+                    results[key] = json.load(cache_file)
+
+    todo = [(point, key) for point, key in zip(points, keys)
+            if key not in results]
+    args = ([point for point, _ in todo],
+            [boards[point['layout']] for point, _ in todo],
+            [num_games] * len(todo),
+            [int(key[:16], 16) for _, key in todo],
+            [engine] * len(todo))
+    if workers == 1:
+        _store(todo, map(_run_point, *args), results, cache_dir)
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            _store(todo, executor.map(_run_point, *args), results,
+                   cache_dir)
+
+    return [row for key in keys for row in results[key]]
@@ -3,8 +3,13 @@
 __author__ = 'Alf Georg Ovland', 'Nicolai Munsterhjelm'
 __email__ = 'alov@nmbu.no', 'nicmunst@nmbu.no'
 
+import json
+import pickle
 import random
+import chutes_dice
+import chutes_kernel
 import chutes_simulation as cs
+import numpy as np
 import pytest
 
 
@@ -25,6 +30,124 @@ class TestBoard:
         assert b.position_adjustment(49) == 79-49
         assert b.position_adjustment(33) == 3-33
 
+    def test_table(self):
+        """Tests that the transition table maps squares 0 to goal+6 to
+        their final square"""
+        b = cs.Board()
+        assert len(b.table) == b.goal + 7
+        assert b.table[49] == 79
+        assert b.table[33] == 3
+        assert b.table[2] == 2
+        assert b.final_position(49) == 79
+
+    def test_table_rebuilt(self):
+        """Tests that the table follows changes of ladders, chutes and
+        goal"""
+        b = cs.Board()
+        b.ladders = [(2, 20)]
+        assert b.table[2] == 20
+        assert b.table[49] == 49
+        b.chutes = []
+        assert b.table[33] == 33
+        b.goal = 20
+        assert len(b.table) == 27
+        b.chutes[5] = 1
+        assert b.table[5] == 1
+
+    def test_table_follows_dict_edits(self):
+        """Tests that the table is rebuilt when the ladders and chutes
+        dicts are changed in place, also after pickling"""
+        b = cs.Board()
+        b.ladders[3] = 50
+        assert b.final_position(3) == 50
+        del b.ladders[3]
+        assert b.final_position(3) == 3
+        b.chutes.update({4: 2})
+        assert b.table[4] == 2
+        b = pickle.loads(pickle.dumps(b))
+        b.chutes.pop(4)
+        assert b.final_position(4) == 4
+
+    def test_single_key_edits_match_rebuild(self):
+        """Tests that single-key edits, which only rebuild their own
+        square, give the table of a full rebuild and bump table_version"""
+        b = cs.Board()
+        version = b.table_version
+        b.ladders[24] = 60
+        b.chutes[95] = 2
+        del b.ladders[1]
+        b.chutes.pop(33)
+        b.chutes.pop(500, None)
+        assert b.table_version == version + 5
+        assert b.table[24] == 60
+        edited = b.table.copy()
+        squares = list(b._squares)
+        b.build_table()
+        assert (b.table == edited).all()
+        assert b._squares == squares
+
+    def test_duration_distribution_small_board(self):
+        """Tests the exact duration distribution on an empty board with
+        goal 6, where the only one-turn win is rolling a six"""
+        b = cs.Board(ladders=[], chutes=[], goal=6)
+        d = b.duration_distribution(6)
+        assert d[0] == 0
+        assert d[1] == pytest.approx(1 / 6)
+        assert d.sum() == pytest.approx(1)
+
+    def test_duration_distribution_sums_to_one(self):
+        """Tests that the default board distribution is a probability
+        distribution for all player types"""
+        b = cs.Board()
+        for kwargs in [{}, {'extra_steps': 2},
+                       {'dropped_steps': 2, 'lazy': True}]:
+            d = b.duration_distribution(1000, **kwargs)
+            assert all(d >= 0)
+            assert d.sum() == pytest.approx(1, abs=1e-3)
+
+
+class TestMappedBoard:
+    """Tests for the memory-mapped board"""
+    def test_same_as_board(self, tmp_path):
+        """Tests that a saved table gives the same board"""
+        b = cs.Board()
+        path = str(tmp_path / 'board.npy')
+        b.save_table(path)
+        m = cs.MappedBoard(path)
+        assert m.goal == b.goal
+        assert m.ladders == b.ladders
+        assert m.chutes == b.chutes
+        assert [m.final_position(p) for p in range(100)] == \
+            [b.final_position(p) for p in range(100)]
+
+    def test_create(self, tmp_path):
+        """Tests that create writes a board given as arrays"""
+        path = str(tmp_path / 'board.npy')
+        m = cs.MappedBoard.create(path, ladders=np.array([[2, 30]]),
+                                  chutes=[(25, 4)], goal=40)
+        assert m.table.dtype == np.int32
+        assert m.ladders == {2: 30}
+        assert m.chutes == {25: 4}
+        with pytest.raises(TypeError):
+            m.ladders[3] = 10
+        assert isinstance(m.final_position(2), int)
+        with pytest.raises(TypeError):
+            m.build_table()
+
+    def test_simulation(self, tmp_path):
+        """Tests that games on a mapped board and on the board it was
+        saved from are identical, also after pickling the mapped board"""
+        field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+        path = str(tmp_path / 'board.npy')
+        cs.Board().save_table(path)
+        m = pickle.loads(pickle.dumps(cs.MappedBoard(path)))
+        plain = cs.Simulation(field, seed=3, dice='numpy')
+        mapped = cs.Simulation(field, m, seed=3, dice='numpy')
+        plain.run_simulation(100)
+        mapped.run_simulation(50)
+        mapped.run_kernel_simulation(50)
+        assert plain.get_results() == mapped.get_results()
+
 
 class TestPlayer:
     """Tests for Player class"""
@@ -45,6 +168,32 @@ class TestPlayer:
         p.move()
         assert p.position == 7
 
+    def test_reset(self):
+        """Tests that reset puts all player types back at the start"""
+        b = cs.Board()
+        for p in [cs.Player(b), cs.ResilientPlayer(b), cs.LazyPlayer(b)]:
+            for _ in range(10):
+                p.move()
+            p.reset()
+            assert p.position == 0
+            assert p.turns == 0
+        assert not p.ladder_last
+
+    def test_slots(self):
+        """Tests that players have no instance dict"""
+        b = cs.Board()
+        for p in [cs.Player(b), cs.ResilientPlayer(b), cs.LazyPlayer(b)]:
+            assert not hasattr(p, '__dict__')
+
+    def test_follows_board_changes(self):
+        """Tests that a player sees ladders added after it was
+        created"""
+        b = cs.Board(ladders=[], chutes=[])
+        p = cs.Player(b)
+        b.ladders = [(square, 50) for square in range(1, 7)]
+        p.move()
+        assert p.position == 50
+
 
 class TestResilientPlayer:
     """Tests for ResilientPlayer class"""
@@ -85,3 +234,677 @@ class TestSimulation:
         s = cs.Simulation([cs.Player, cs.LazyPlayer, cs.ResilientPlayer])
         s.run_simulation(5)
         assert len(s.winning_list) == 5
+
+    def test_players_reused(self):
+        """Tests that players are reused between games and rebuilt when
+        the field changes"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer])
+        s.single_game()
+        players = s._players
+        s.single_game()
+        assert s._players is players
+        s.player_field.append(cs.ResilientPlayer)
+        s.single_game()
+        assert [type(p) for p in s._players] == s.player_field
+
+
+class TestBatchSimulation:
+    """Tests for the vectorized batch engine of Simulation"""
+    def test_result_format(self):
+        """Tests that run_batch_simulation fills winning_list with
+        (turns, winner type) tuples like run_simulation."""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer, cs.ResilientPlayer],
+                          seed=3)
+        s.run_batch_simulation(250, batch_size=100)
+        assert len(s.winning_list) == 250
+        for turns, winner in s.winning_list:
+            assert isinstance(turns, int) and turns > 0
+            assert winner in ['Player', 'LazyPlayer', 'ResilientPlayer']
+
+    def test_first_player_wins_on_tiny_board(self):
+        """On a board that is finished in one move the first player in the
+        field always wins in one turn."""
+        b = cs.Board(ladders=[], chutes=[], goal=1)
+        s = cs.Simulation([cs.LazyPlayer, cs.Player], board=b)
+        s.run_batch_simulation(20)
+        assert s.winning_list == [(1, 'LazyPlayer')] * 20
+
+    def test_seed_reproducible(self):
+        """Tests that equal seeds give equal results."""
+        field = [cs.Player, cs.ResilientPlayer]
+        s1 = cs.Simulation(field, seed=12)
+        s2 = cs.Simulation(field, seed=12)
+        s1.run_batch_simulation(50)
+        s2.run_batch_simulation(50)
+        assert s1.winning_list == s2.winning_list
+
+    def test_mean_duration_matches_run_simulation(self):
+        """Tests that the batch engine and the move by move engine give
+        the same mean game duration within statistical error."""
+        field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+        random.seed(5)
+        s_loop = cs.Simulation(field)
+        s_loop.run_simulation(2000)
+        s_batch = cs.Simulation(field, seed=5)
+        s_batch.run_batch_simulation(2000)
+        loop_mean = sum(t for t, _ in s_loop.winning_list) / 2000
+        batch_mean = sum(t for t, _ in s_batch.winning_list) / 2000
+        assert abs(loop_mean - batch_mean) < 2
+
+    def test_other_player_classes_refused(self):
+        """Tests that the engines refuse player classes with move rules
+        they cannot know, while players_per_type still counts them."""
+        class CarefulPlayer(cs.Player):
+            pass
+
+        s = cs.Simulation([cs.Player, CarefulPlayer], dice='numpy')
+        with pytest.raises(ValueError):
+            s.run_batch_simulation(10)
+        with pytest.raises(ValueError):
+            s.run_kernel_simulation(10)
+        with pytest.raises(ValueError):
+            s.exact_durations_per_type(10)
+        assert s.players_per_type() == {'Player': 1, 'CarefulPlayer': 1}
+
+
+class TestExactSolver:
+    """Tests for the exact Markov chain solver of Simulation"""
+    def test_probabilities_sum_to_one(self):
+        """Tests that the win probabilities of all types sum to one"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer, cs.ResilientPlayer])
+        exact = s.exact_durations_per_type(1000)
+        assert sum(d.sum() for d in exact.values()) == pytest.approx(1)
+
+    def test_matches_monte_carlo(self):
+        """Tests that the exact win probabilities agree with the batch
+        engine within statistical error"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer, cs.ResilientPlayer],
+                          seed=4)
+        exact = s.exact_durations_per_type(1000)
+        s.run_batch_simulation(20000)
+        wins = s.winners_per_type()
+        for name, distribution in exact.items():
+            assert wins[name] / 20000 == pytest.approx(distribution.sum(),
+                                                       abs=0.02)
+
+
+class TestParallelSimulation:
+    """Tests for the sharded multiprocess simulation"""
+    @pytest.mark.parametrize('engine', ['python', 'batch'])
+    def test_independent_of_workers(self, engine):
+        """Tests that the results for a seed do not depend on the number
+        of worker processes"""
+        field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+        results = []
+        for workers in [1, 2, 3]:
+            s = cs.Simulation(field, seed=42)
+            s.run_parallel_simulation(250, workers=workers, chunk_size=40,
+                                      engine=engine)
+            results.append(s.get_results())
+        assert len(results[0]) == 250
+        assert results[0] == results[1] == results[2]
+
+    def test_global_random_state_untouched(self):
+        """Tests that running chunks in process leaves the random module
+        state as it was"""
+        random.seed(7)
+        expected = random.random()
+        random.seed(7)
+        s = cs.Simulation([cs.Player, cs.Player], seed=1)
+        s.run_parallel_simulation(10, workers=1, chunk_size=4)
+        assert random.random() == expected
+
+    def test_continues_seed_stream(self):
+        """Tests that two calls do not repeat the same games"""
+        s = cs.Simulation([cs.Player, cs.Player], seed=3)
+        s.run_parallel_simulation(50, workers=1)
+        s.run_parallel_simulation(50, workers=1)
+        r = s.get_results()
+        assert r[:50] != r[50:]
+
+
+class TestStreamingResults:
+    """Tests for the running result statistics"""
+    def test_matches_stored_results(self):
+        """Tests that the aggregator agrees with statistics computed from
+        winning_list for all engines"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer, cs.ResilientPlayer],
+                          seed=8)
+        s.run_simulation(100)
+        s.run_batch_simulation(300, batch_size=70)
+        s.run_parallel_simulation(50, workers=1)
+        durations = s.durations_per_type()
+        assert s.winners_per_type() == {name: len(turns) for name, turns
+                                        in durations.items()}
+        means = s.aggregator.mean_duration_per_type()
+        variances = s.aggregator.variance_duration_per_type()
+        for name, turns in durations.items():
+            mean = sum(turns) / len(turns)
+            variance = sum((t - mean) ** 2 for t in turns) / (len(turns) - 1)
+            assert means[name] == pytest.approx(mean)
+            assert variances[name] == pytest.approx(variance)
+            assert sum(s.aggregator.duration_histogram_per_type()[name]
+                       .values()) == len(turns)
+
+    def test_without_keeping_results(self):
+        """Tests that keep_results=False only keeps statistics"""
+        s = cs.Simulation([cs.Player, cs.Player], keep_results=False)
+        s.run_simulation(20)
+        s.run_batch_simulation(30)
+        assert s.get_results() == []
+        assert s.winners_per_type()['Player'] == 50
+        assert s.aggregator.num_games == 50
+        with pytest.raises(RuntimeError):
+            s.durations_per_type()
+
+
+class TestCompactResults:
+    """Tests for the columnar result store"""
+    def test_same_results_as_list(self):
+        """Tests that the compact store holds the same results as the
+        list of tuples"""
+        field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+        s_list = cs.Simulation(field, seed=2)
+        s_store = cs.Simulation(field, seed=2, compact_results=True)
+        for s in (s_list, s_store):
+            s.run_batch_simulation(3000, batch_size=1000)
+            s.winning_list.append((5, 'Player'))
+        r = s_store.get_results()
+        assert len(r) == 3001
+        assert r == s_list.get_results()
+        assert r[-1] == (5, 'Player')
+        assert r[:2] == s_list.get_results()[:2]
+
+    def test_durations_per_type(self):
+        """Tests that grouped durations keep the order of the games"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer],
+                          compact_results=True)
+        s.run_simulation(100)
+        expected = {}
+        for turns, name in s.get_results():
+            expected.setdefault(name, []).append(turns)
+        assert s.durations_per_type() == expected
+        assert s.winning_list.winners_per_type() == s.winners_per_type()
+
+    def test_to_numpy(self):
+        """Tests that to_numpy exposes the columns"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer], seed=1,
+                          compact_results=True)
+        s.run_batch_simulation(50)
+        turns, codes = s.winning_list.to_numpy()
+        assert len(turns) == len(codes) == 50
+        assert turns.base is not None
+        names = s.winning_list.type_names
+        assert [(int(t), names[c]) for t, c in zip(turns, codes)] \
+            == list(s.get_results())
+
+
+class _InterruptedSimulation(cs.Simulation):
+    """Simulation that is killed after a number of games or batches"""
+    games_before_kill = 0
+
+    def single_game(self):
+        if self.games_before_kill == 0:
+            raise KeyboardInterrupt
+        self.games_before_kill -= 1
+        return super().single_game()
+
+    def _play_batch(self, *args):
+        if self.games_before_kill == 0:
+            raise KeyboardInterrupt
+        self.games_before_kill -= 1
+        return super()._play_batch(*args)
+
+
+class TestCheckpoint:
+    """Tests for checkpointed runs"""
+    field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+
+    def test_resume_python_engine(self, tmp_path):
+        """Tests that a killed and resumed run gives the same results as
+        an uninterrupted run"""
+        path = str(tmp_path / 'run.bin')
+        random.seed(11)
+        full = cs.Simulation(self.field)
+        full.run_checkpointed(60, path, interval=0)
+
+        random.seed(11)
+        killed = _InterruptedSimulation(self.field)
+        killed.games_before_kill = 25
+        with pytest.raises(KeyboardInterrupt):
+            killed.run_checkpointed(60, path, interval=0)
+        random.seed(99)
+        resumed = cs.Simulation.resume(path)
+        assert resumed.get_results() == full.get_results()
+        assert resumed.winners_per_type() == full.winners_per_type()
+        assert len(cs.CheckpointFile(path).records()) == 60
+
+    def test_resume_batch_engine(self, tmp_path):
+        """Tests resuming the batch engine, including results written
+        after the last saved state"""
+        path = str(tmp_path / 'run.bin')
+        full = cs.Simulation(self.field, seed=5, compact_results=True)
+        full.run_checkpointed(500, path, engine='batch', batch_size=50)
+
+        killed = _InterruptedSimulation(self.field, seed=5,
+                                        compact_results=True)
+        killed.games_before_kill = 4
+        with pytest.raises(KeyboardInterrupt):
+            killed.run_checkpointed(500, path, interval=0, engine='batch',
+                                    batch_size=50)
+        checkpoint = cs.CheckpointFile(path)
+        checkpoint.append([1, 2], [0, 0], checkpoint.load_state())
+        resumed = cs.Simulation.resume(path)
+        assert resumed.get_results() == full.get_results()
+        records = checkpoint.records()
+        assert records['turns'].tolist() == \
+            [turns for turns, _ in full.get_results()]
+
+
+class TestBenchmark:
+    """Smoke test for the benchmark suite"""
+    def test_run_benchmarks(self):
+        """Tests that the benchmarks run and report all cases"""
+        import bench_chutes
+        results = bench_chutes.run_benchmarks(num_games=20,
+                                              goals=[90, 500],
+                                              fields=['mixed'])
+        assert len(results) == 8
+        assert all(row['peak_memory_bytes'] >= 0 for row in results)
+        board = bench_chutes.make_board(500)
+        assert board.goal == 500
+        assert len(board.ladders) + len(board.chutes) == 75
+
+
+class TestDice:
+    """Tests for the dice backends"""
+    @pytest.mark.parametrize('name', ['stdlib', 'numpy', 'lcg'])
+    def test_rolls(self, name):
+        """Tests that all faces are rolled about equally often"""
+        dice = chutes_dice.DICE[name](3)
+        rolls = [dice.roll() for _ in range(6000)]
+        assert set(rolls) == {1, 2, 3, 4, 5, 6}
+        assert all(800 < rolls.count(face) < 1200 for face in range(1, 7))
+
+    @pytest.mark.parametrize('name', ['stdlib', 'numpy', 'lcg'])
+    def test_state(self, name):
+        """Tests that setstate continues the sequence from getstate"""
+        dice = chutes_dice.DICE[name](3)
+        for _ in range(10):
+            dice.roll()
+        state = dice.getstate()
+        first = [dice.roll() for _ in range(20)]
+        other = chutes_dice.DICE[name](4)
+        other.setstate(state)
+        assert [other.roll() for _ in range(20)] == first
+
+    @pytest.mark.parametrize('name', ['stdlib', 'numpy', 'lcg'])
+    def test_simulation_seeded(self, name):
+        """Tests that simulations with the same seed and backend give the
+        same results"""
+        field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+        s1 = cs.Simulation(field, seed=6, dice=name)
+        s2 = cs.Simulation(field, seed=6, dice=name)
+        s1.run_simulation(30)
+        s2.run_simulation(30)
+        assert s1.get_results() == s2.get_results()
+
+    def test_numpy_block_boundaries(self):
+        """Tests that a small block size gives the same rolls as a large
+        one"""
+        small = chutes_dice.NumpyDice(5, block_size=7)
+        large = chutes_dice.NumpyDice(5)
+        assert [small.roll() for _ in range(30)] == \
+            [large.roll() for _ in range(30)]
+
+    def test_parallel_and_checkpoint(self, tmp_path):
+        """Tests that dice backends work with sharded and checkpointed
+        runs"""
+        field = [cs.Player, cs.LazyPlayer]
+        s1 = cs.Simulation(list(field), seed=2, dice='numpy')
+        s2 = cs.Simulation(list(field), seed=2, dice='numpy')
+        s1.run_parallel_simulation(40, workers=1, chunk_size=10)
+        s2.run_parallel_simulation(40, workers=2, chunk_size=10)
+        assert s1.get_results() == s2.get_results()
+
+        path = str(tmp_path / 'run.bin')
+        full = cs.Simulation(list(field), seed=2, dice='stdlib')
+        full.run_checkpointed(30, path)
+        killed = _InterruptedSimulation(list(field), seed=2, dice='stdlib')
+        killed.games_before_kill = 12
+        with pytest.raises(KeyboardInterrupt):
+            killed.run_checkpointed(30, path, interval=0)
+        assert cs.Simulation.resume(path).get_results() == \
+            full.get_results()
+
+
+class _CountingDice(chutes_dice.StdlibDice):
+    """Dice that count how often they are rolled"""
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self.rolls = 0
+
+    def roll(self):
+        self.rolls += 1
+        return super().roll()
+
+
+class TestTailTable:
+    """Tests for finishing players near the goal in one step"""
+    field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+
+    def test_tail_stream_seeding(self):
+        """Tests that the tail draws are reproducible with a seed and
+        independent without one"""
+        def draws(seed):
+            s = cs.Simulation(self.field, seed=seed, dice='stdlib',
+                              tail_table=6)
+            return [s._tail_uniform() for _ in range(3)]
+        assert draws(3) == draws(3)
+        assert draws(None) != draws(None)
+
+    def test_remaining_cdfs(self):
+        """Tests the one-roll win probabilities on an empty board"""
+        b = cs.Board(ladders=[], chutes=[], goal=10)
+        cdfs = b.remaining_cdfs([3, 4, 9])
+        assert cdfs[0][1] == pytest.approx(0)
+        assert cdfs[1][1] == pytest.approx(1 / 6)
+        assert cdfs[2][1] == pytest.approx(1)
+        assert cdfs[0][-1] == pytest.approx(1)
+
+    def test_fewer_moves(self):
+        """Tests that the tail table reduces the number of moves"""
+        moves = []
+        for tail in [0, 6]:
+            dice = _CountingDice(1)
+            s = cs.Simulation(self.field, seed=1, dice=dice,
+                              tail_table=tail)
+            s.run_simulation(2000)
+            moves.append(dice.rolls)
+        assert moves[1] < moves[0]
+
+    @pytest.mark.parametrize('tail', [6, 90])
+    def test_statistically_equivalent(self, tail):
+        """Tests that win rates and the duration distribution agree with
+        the exact solution. The limits are about four standard errors."""
+        num_games = 20000
+        s = cs.Simulation(self.field, seed=9, dice='stdlib',
+                          tail_table=tail)
+        s.run_simulation(num_games)
+        exact = s.exact_durations_per_type(2000)
+        wins = s.winners_per_type()
+        for name, distribution in exact.items():
+            assert wins[name] / num_games == \
+                pytest.approx(distribution.sum(), abs=0.015)
+
+        exact_cdf = np.cumsum(sum(exact.values()))
+        counts = np.bincount([turns for turns, _ in s.get_results()],
+                             minlength=len(exact_cdf))
+        simulated_cdf = np.cumsum(counts[:len(exact_cdf)]) / num_games
+        assert np.abs(simulated_cdf - exact_cdf).max() < 0.015
+
+    def test_tables_follow_changes(self):
+        """Tests that the cached tables are rebuilt after chutes are added
+        in place and tail_table is widened between games. The limit is
+        about six standard errors."""
+        s = cs.Simulation([cs.Player, cs.Player], seed=1, dice='stdlib',
+                          tail_table=10)
+        s.run_simulation(1)
+        for square in (84, 86, 88):
+            s.board.chutes[square] = 1
+        s.tail_table = 20
+        s.run_simulation(3000)
+        exact = sum(s.exact_durations_per_type(3000).values())
+        exact_mean = (np.arange(len(exact)) * exact).sum()
+        turns = [turns for turns, _ in s.get_results()[1:]]
+        assert np.mean(turns) == pytest.approx(exact_mean, rel=0.1)
+
+    def test_checkpoint_resume(self, tmp_path):
+        """Tests that tail table runs resume exactly"""
+        path = str(tmp_path / 'run.bin')
+        full = cs.Simulation(self.field, seed=2, dice='numpy', tail_table=6)
+        full.run_checkpointed(40, path)
+        killed = _InterruptedSimulation(self.field, seed=2, dice='numpy',
+                                        tail_table=6)
+        killed.games_before_kill = 15
+        with pytest.raises(KeyboardInterrupt):
+            killed.run_checkpointed(40, path, interval=0)
+        assert cs.Simulation.resume(path).get_results() == \
+            full.get_results()
+
+
+class TestSweep:
+    """Tests for parameter sweeps"""
+    grid = {'field': [('Player', 'ResilientPlayer'), ('LazyPlayer',)],
+            'extra_steps': [1, 4], 'layout': [None, 'short']}
+    layouts = {'short': {'ladders': [(2, 20)], 'chutes': [(15, 1)],
+                         'goal': 30}}
+
+    def test_grid_points(self):
+        """Tests that all distinct combinations are listed, with
+        parameters of player types not in the field set to None"""
+        import chutes_sweep
+        points = chutes_sweep.grid_points(self.grid)
+        assert len(points) == 6
+        assert all((p['extra_steps'] is None)
+                   == ('ResilientPlayer' not in p['field'])
+                   and (p['dropped_steps'] is None)
+                   == ('LazyPlayer' not in p['field']) for p in points)
+        with pytest.raises(ValueError):
+            chutes_sweep.grid_points({'speed': [1]})
+
+    def test_player_field(self):
+        """Tests that parameters are bound to the player types"""
+        import chutes_sweep
+        point = dict(chutes_sweep.DEFAULTS, field=('ResilientPlayer',),
+                     num_players=3, extra_steps=5)
+        field = chutes_sweep.player_field(point)
+        assert len(field) == 3
+        assert field[0](cs.Board()).extra_steps == 5
+        s = cs.Simulation(field)
+        assert s.players_per_type() == {'ResilientPlayer': 3}
+
+    def test_sweep_and_cache(self, tmp_path):
+        """Tests that the sweep returns one row per point and type, does
+        not depend on the number of workers and reuses cached points"""
+        import chutes_sweep
+        cache = str(tmp_path / 'cache')
+        rows = chutes_sweep.sweep(self.grid, 200, self.layouts,
+                                  cache_dir=cache, workers=2)
+        assert len(rows) == 10
+        assert all(0 <= row['win_rate'] <= 1 for row in rows)
+        assert sum(row['wins'] for row in rows) == 6 * 200
+        assert len(list((tmp_path / 'cache').iterdir())) == 6
+
+        serial = chutes_sweep.sweep(self.grid, 200, self.layouts,
+                                    workers=1)
+        assert serial == rows
+
+        for path in (tmp_path / 'cache').iterdir():
+            rows_in_file = json.loads(path.read_text())
+            rows_in_file[0]['wins'] = -1
+            path.write_text(json.dumps(rows_in_file))
+        cached = chutes_sweep.sweep(self.grid, 200, self.layouts,
+                                    cache_dir=cache, workers=1)
+        assert all(row['wins'] == -1 for row in cached
+                   if row['player_type'] in ('Player', 'LazyPlayer'))
+
+
+class TestCommonRandomNumbers:
+    """Tests for comparing fields with common random numbers"""
+    def test_same_field_identical(self):
+        """Tests that the same field gives identical games"""
+        s = cs.Simulation([], seed=3)
+        field = [cs.Player, cs.LazyPlayer]
+        results = s.run_common_random_numbers([field, list(field)], 50)
+        assert results[0] == results[1]
+        assert cs.paired_win_rate_difference(*results) == (0, 0)
+
+    def test_slot_rolls_shared(self):
+        """Tests that a slot gets the same rolls in every field"""
+        b = cs.Board(ladders=[], chutes=[], goal=7)
+        s = cs.Simulation([], board=b, seed=3)
+        results = s.run_common_random_numbers(
+            [[cs.Player, cs.Player], [cs.LazyPlayer, cs.Player]], 200)
+        assert results[0] == [(turns, 'Player', slot)
+                              for turns, _, slot in results[1]]
+
+    def test_variance_reduction(self):
+        """Tests that the paired standard error is smaller than the error
+        of two independent estimates"""
+        s = cs.Simulation([], seed=1)
+        results = s.run_common_random_numbers(
+            [[cs.Player] * 3, [cs.ResilientPlayer] + [cs.Player] * 2], 4000)
+        _, paired_error = cs.paired_win_rate_difference(results[1],
+                                                        results[0])
+        wins = [np.array([slot == 0 for _, _, slot in field_results])
+                for field_results in results]
+        independent_error = np.sqrt(sum(w.var() for w in wins) / 4000)
+        assert paired_error < 0.8 * independent_error
+
+
+class TestRunUntil:
+    """Tests for running until a target precision"""
+    def test_win_rate_precision(self):
+        """Tests that run_until stops once all win rates are precise
+        enough"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer, cs.ResilientPlayer],
+                          seed=1)
+        report = s.run_until(0.02, batch_size=500)
+        assert report['converged']
+        assert report['games'] == len(s.get_results())
+        assert all(half_width <= 0.02
+                   for _, half_width in report['estimates'].values())
+        assert report['games'] < 5000
+
+    def test_mean_duration(self):
+        """Tests the mean duration metric against the stored results"""
+        s = cs.Simulation([cs.Player, cs.Player], seed=1)
+        report = s.run_until(0.5, metric='mean_duration', batch_size=200,
+                             engine='python')
+        mean, half_width = report['estimates']['all']
+        turns = [t for t, _ in s.get_results()]
+        assert mean == pytest.approx(sum(turns) / len(turns))
+        assert half_width <= 0.5
+
+    def test_max_games(self):
+        """Tests that max_games stops a run that cannot converge"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer], seed=1)
+        report = s.run_until(1e-6, batch_size=300, max_games=1000)
+        assert not report['converged']
+        assert report['games'] == 1000
+        with pytest.raises(ValueError):
+            s.confidence_intervals('median')
+
+    def test_no_games(self):
+        """Tests that intervals need at least one game"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer])
+        for metric in ('win_rate', 'mean_duration'):
+            with pytest.raises(ValueError):
+                s.confidence_intervals(metric)
+
+
+class TestProfiling:
+    """Tests for the profiling instrumentation"""
+    def test_counts(self):
+        """Tests that the profiler counts moves, games and hits"""
+        s = cs.Simulation([cs.Player, cs.LazyPlayer, cs.ResilientPlayer],
+                          seed=1, dice='stdlib')
+        profiler = s.enable_profiling(sample_every=10)
+        s.run_simulation(200)
+        report = profiler.report()
+        assert report['games'] == 200
+        assert sum(report['moves_per_game'].values()) == 200
+        assert report['sampled_moves'] == report['moves'] // 10
+        assert set(report['ladder_hits']) <= set(s.board.ladders)
+        assert set(report['chute_hits']) <= set(s.board.chutes)
+        assert all(t is not None and t >= 0 or phase == 'bookkeeping'
+                   for phase, t in report['ns_per_move'].items())
+        heatmap = profiler.heatmap()
+        assert heatmap.shape == (9, 10)
+        assert np.nansum(heatmap) == sum(report['ladder_hits'].values()) \
+            + sum(report['chute_hits'].values())
+
+    def test_same_games(self):
+        """Tests that profiling does not change the games played"""
+        field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+        plain = cs.Simulation(field, seed=4, dice='numpy')
+        profiled = cs.Simulation(field, seed=4, dice='numpy')
+        profiled.enable_profiling()
+        plain.run_simulation(50)
+        profiled.run_simulation(50)
+        assert plain.get_results() == profiled.get_results()
+        profiled.disable_profiling()
+        assert profiled.profiler is None
+
+    def test_unsupported(self):
+        """Tests that profiling refuses tail tables and replaced boards"""
+        s = cs.Simulation([cs.Player], tail_table=6)
+        with pytest.raises(ValueError):
+            s.enable_profiling()
+        s = cs.Simulation([cs.Player])
+        s.enable_profiling()
+        s.board = cs.Board(goal=30)
+        with pytest.raises(ValueError):
+            s.single_game()
+        s.enable_profiling()
+        s.run_simulation(2)
+        assert s.profiler.report()['games'] == 2
+
+    def test_board_edited_in_place(self):
+        """Tests that the hit counters follow a table that grows after
+        profiling was enabled"""
+        s = cs.Simulation([cs.Player], seed=3)
+        s.enable_profiling()
+        s.run_simulation(5)
+        hits = s.profiler.chute_hits[:90].copy()
+        s.board.goal = 300
+        s.board.ladders[200] = 250
+        s.run_simulation(50)
+        assert len(s.profiler.ladder_hits) == len(s.board.table)
+        assert s.profiler.ladder_hits[200] > 0
+        assert (s.profiler.chute_hits[:90] >= hits).all()
+
+    def test_save_report(self, tmp_path):
+        """Tests that the report is written as JSON"""
+        s = cs.Simulation([cs.Player])
+        profiler = s.enable_profiling()
+        s.run_simulation(5)
+        path = tmp_path / 'profile.json'
+        profiler.save_report(str(path))
+        report = json.loads(path.read_text())
+        assert report['games'] == 5
+        assert len(report['heatmap']) == 9
+
+
+class TestKernel:
+    """Tests for the compiled game loop"""
+    def test_same_as_python(self):
+        """Tests that the kernel plays the same games as run_simulation,
+        also with games spanning several blocks of rolls"""
+        field = [cs.Player, cs.LazyPlayer, cs.ResilientPlayer]
+        python = cs.Simulation(field, seed=5, dice='numpy')
+        kernel = cs.Simulation(field, seed=5, dice='numpy')
+        python.dice.block_size = kernel.dice.block_size = 50
+        python.run_simulation(300)
+        kernel.run_kernel_simulation(100)
+        kernel.run_simulation(100)
+        kernel.run_kernel_simulation(100)
+        assert python.get_results() == kernel.get_results()
+
+    def test_fallback(self, monkeypatch):
+        """Tests that the pure Python loop gives the same results"""
+        field = [cs.ResilientPlayer, cs.LazyPlayer]
+        compiled = cs.Simulation(field, seed=2, dice='numpy')
+        compiled.run_kernel_simulation(200)
+        monkeypatch.setattr(chutes_kernel, 'COMPILED', False)
+        monkeypatch.setattr(chutes_kernel, 'play_games',
+                            chutes_kernel._play_games)
+        fallback = cs.Simulation(field, seed=2, dice='numpy')
+        fallback.run_kernel_simulation(200)
+        assert compiled.get_results() == fallback.get_results()
+
+    def test_needs_numpy_dice(self):
+        """Tests that the kernel refuses other dice"""
+        with pytest.raises(ValueError):
+            cs.Simulation([cs.Player], dice='stdlib').run_kernel_simulation(1)
@@ -1,8 +1,46 @@
+import math
 import random
-from statistics import median, mean, stdev
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from statistics import StatisticsError
 
+import numpy as np
 
-def single_game(num_players):
+GOAL = 90
+SNAKES_AND_LADDERS = {1: 40, 8: 10, 36: 52, 43: 62, 49: 79, 65: 82, 68: 85,
+                      24: 5, 33: 3, 42: 30, 56: 37, 64: 27, 74: 12, 87: 70}
+
+
+def make_board(snakes_and_ladders=None, goal=GOAL):
+    """
+    Returns a board as a lookup list, where element i is the position a
+    player landing on position i ends up on. It covers every position a
+    player can land on, from 0 to goal + 5, so its length gives the goal.
+
+    Arguments
+    ---------
+    snakes_and_ladders : dict or list of tuples
+        {start: end} of the snakes and ladders, default SNAKES_AND_LADDERS
+    goal : int
+        Position a player must reach to win
+
+    Returns
+    -------
+    board : list
+    """
+    if snakes_and_ladders is None:
+        snakes_and_ladders = SNAKES_AND_LADDERS
+    board = list(range(goal + 6))
+    for start, end in dict(snakes_and_ladders).items():
+        board[start] = end
+    return board
+
+
+DEFAULT_BOARD = make_board()
+
+
+def single_game(num_players, board=DEFAULT_BOARD, rand=random):
     """
     Returns duration of single game.
 
@@ -10,6 +48,10 @@ def single_game(num_players):
     ---------
     num_players : int
         Number of players in the game
+    board : list
+        Board made with make_board
+    rand : random.Random
+        Source of the dice rolls, default the random module
 
     Returns
     -------
@@ -18,15 +60,17 @@ def single_game(num_players):
     """
     num_moves = 0
     players = create_players(num_players)
-    while not game_ends(players):
+    goal = len(board) - 6
+    while not game_ends(players, goal):
         for player_num, position in enumerate(players):
-            players[player_num] = one_move(position)
+            players[player_num] = one_move(position, board, rand)
         num_moves += 1
 
     return num_moves
 
 
-def multiple_games(num_games, num_players):
+def multiple_games(num_games, num_players, engine='python',
+                   board=DEFAULT_BOARD, rand=random):
     """
     Returns durations of a number of games.
 
@@ -36,19 +80,35 @@ def multiple_games(num_games, num_players):
         Number of games to play
     num_players : int
         Number of players in the game
+    engine : str
+        'python' plays the games one by one with single_game, 'numpy'
+        plays them together with batch_games. The numpy engine draws its
+        own dice, seeded from rand, so its results are statistically,
+        not game by game, equal to the python engine.
+    board : list
+        Board made with make_board
+    rand : random.Random
+        Source of the dice rolls, default the random module
 
     Returns
     -------
     num_moves : list
         List with the numbedr of moves needed in each game.
     """
+    if engine == 'numpy':
+        rng = np.random.default_rng(rand.getrandbits(64))
+        return batch_games(num_games, num_players, rng, board).tolist()
+    elif engine != 'python':
+        raise ValueError("Error: engine must be 'python' or 'numpy'.")
+
     num_moves = []
     for i in range(num_games):
-        num_moves.append(single_game(num_players))
+        num_moves.append(single_game(num_players, board, rand))
     return num_moves
 
 
-def multi_game_experiment(num_games, num_players, seed):
+def multi_game_experiment(num_games, num_players, seed, engine='python',
+                          board=DEFAULT_BOARD):
     """
     Returns durations of a number of games when playing with given seed.
 
@@ -59,7 +119,12 @@ def multi_game_experiment(num_games, num_players, seed):
     num_players : int
         Number of players in the game
     seed : int
-        Seed used to initialise the random number generator
+        Seed of the random.Random instance the dice are rolled with. The
+        random module itself is not reseeded.
+    engine : str
+        'python' or 'numpy', see multiple_games
+    board : list
+        Board made with make_board
 
     Returns
     -------
@@ -67,11 +132,202 @@ def multi_game_experiment(num_games, num_players, seed):
         List with the numbedr of moves needed in each game.
     """
 
-    random.seed(seed)
-    num_moves = multiple_games(num_games, num_players)
+    num_moves = multiple_games(num_games, num_players, engine, board,
+                               random.Random(seed))
     return num_moves
 
 
+def _run_experiment(experiment, engine, board):
+    """Runs one (num_games, num_players, seed) experiment. Module level so
+    that it can be sent to worker processes."""
+    num_games, num_players, seed = experiment
+    return multi_game_experiment(num_games, num_players, seed, engine, board)
+
+
+def run_experiments(experiments, engine='python', board=DEFAULT_BOARD,
+                    workers=None):
+    """
+    Runs several experiments on a process pool. Every experiment rolls
+    with its own random.Random seeded with its seed, so the results are
+    the same as running multi_game_experiment for each of them in turn.
+
+    Arguments
+    ---------
+    experiments : list
+        (num_games, num_players, seed) tuples
+    engine : str
+        'python' or 'numpy', see multiple_games
+    board : list
+        Board made with make_board
+    workers : int
+        Number of processes, 1 runs the experiments in this process
+
+    Returns
+    -------
+    results : list
+        List of game durations for each experiment, in the same order
+    """
+    run = partial(_run_experiment, engine=engine, board=board)
+    if workers == 1:
+        return list(map(run, experiments))
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(run, experiments))
+
+
+def batch_games(num_games, num_players, rng, board=DEFAULT_BOARD,
+                batch_size=10000):
+    """
+    Plays num_games games together as NumPy arrays. Every round, all
+    players in all unfinished games move at once, and a game ends after
+    the round in which a player reaches the goal, as in single_game.
+
+    Arguments
+    ---------
+    num_games : int
+        Number of games to play
+    num_players : int
+        Number of players in the game
+    rng : np.random.Generator
+        Generator the dice rolls are drawn from
+    board : list
+        Board made with make_board
+    batch_size : int
+        Number of games played at a time, to limit memory use
+
+    Returns
+    -------
+    num_moves : np.ndarray
+        Number of moves needed in each game.
+    """
+    create_players(num_players)
+    table = np.asarray(board)
+    goal = len(board) - 6
+    num_moves = np.zeros(num_games, dtype=np.int64)
+    for first in range(0, num_games, batch_size):
+        size = min(batch_size, num_games - first)
+        positions = np.zeros((size, num_players), dtype=np.int64)
+        active = np.arange(size)
+        moves = 0
+        while active.size > 0:
+            moves += 1
+            rolls = rng.integers(1, 7, size=(active.size, num_players))
+            moved = table[positions[active] + rolls]
+            positions[active] = moved
+            ended = (moved >= goal).any(axis=1)
+            num_moves[first + active[ended]] = moves
+            active = active[~ended]
+    return num_moves
+
+
+class DurationStats:
+    """
+    Collects game durations as counts per number of moves, so that any
+    number of games is summarised in a single pass and in memory that
+    only grows with the number of distinct durations. As durations are
+    integers, the statistics are exact.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, num_moves):
+        """Adds the duration of one game."""
+        self.counts[num_moves] += 1
+
+    def add_many(self, num_moves):
+        """Adds the durations in an array or list."""
+        values, counts = np.unique(num_moves, return_counts=True)
+        self.counts.update(dict(zip(values.tolist(), counts.tolist())))
+
+    def count(self):
+        """Number of games added."""
+        return sum(self.counts.values())
+
+    def minimum(self):
+        """Shortest duration."""
+        if not self.counts:
+            raise StatisticsError('no minimum for no games')
+        return min(self.counts)
+
+    def maximum(self):
+        """Longest duration."""
+        if not self.counts:
+            raise StatisticsError('no maximum for no games')
+        return max(self.counts)
+
+    def mean(self):
+        """Mean duration, as statistics.mean."""
+        n = self.count()
+        if n == 0:
+            raise StatisticsError('no mean for no games')
+        return sum(moves * k for moves, k in self.counts.items()) / n
+
+    def stdev(self):
+        """Sample standard deviation, as statistics.stdev."""
+        n = self.count()
+        if n < 2:
+            raise StatisticsError('stdev requires at least two games')
+        total = sum(moves * k for moves, k in self.counts.items())
+        squares = sum(moves ** 2 * k for moves, k in self.counts.items())
+        return math.sqrt((n * squares - total ** 2) / (n * (n - 1)))
+
+    def median(self):
+        """Median, averaging the two middle values for an even count."""
+        n = self.count()
+        if n == 0:
+            raise StatisticsError('no median for no games')
+        middle = [(n - 1) // 2, n // 2]
+        found = []
+        seen = 0
+        for moves in sorted(self.counts):
+            seen += self.counts[moves]
+            while middle and middle[0] < seen:
+                found.append(moves)
+                middle.pop(0)
+        return (found[0] + found[1]) / 2
+
+
+def multiple_games_stats(num_games, num_players, engine='python',
+                         board=DEFAULT_BOARD, batch_size=10000,
+                         rand=random):
+    """
+    Plays games like multiple_games, but adds their durations to a
+    DurationStats instead of returning them as a list, so that very many
+    games can be played in constant memory.
+
+    Arguments
+    ---------
+    num_games : int
+        Number of games to play
+    num_players : int
+        Number of players in the game
+    engine : str
+        'python' or 'numpy', see multiple_games
+    board : list
+        Board made with make_board
+    batch_size : int
+        Number of games the numpy engine plays at a time
+    rand : random.Random
+        Source of the dice rolls, default the random module
+
+    Returns
+    -------
+    stats : DurationStats
+    """
+    stats = DurationStats()
+    if engine == 'numpy':
+        rng = np.random.default_rng(rand.getrandbits(64))
+        for first in range(0, num_games, batch_size):
+            stats.add_many(batch_games(min(batch_size, num_games - first),
+                                       num_players, rng, board))
+    elif engine == 'python':
+        for i in range(num_games):
+            stats.add(single_game(num_players, board, rand))
+    else:
+        raise ValueError("Error: engine must be 'python' or 'numpy'.")
+    return stats
+
+
 def create_players(n):
     """
     Creates a list of zeroes representing the starting position of players.
@@ -83,56 +339,53 @@ def create_players(n):
     return [0] * n
 
 
-def dice_roll():
+def dice_roll(rand=random):
     """
     Returns the result of a dice roll.
     """
-    return random.randint(1, 6)
+    return rand.randint(1, 6)
 
 
-def one_move(starting_position):
+def one_move(starting_position, board=DEFAULT_BOARD, rand=random):
     """
     Plays one move in the game. Returns the position after
      the turn has finished.
      """
-    roll = dice_roll()
+    roll = dice_roll(rand)
     middle_position = starting_position + roll
-    end_position = check_if_snake_or_ladder(middle_position)
+    end_position = board[middle_position]
 
     return end_position
 
 
-def check_if_snake_or_ladder(position):
+def check_if_snake_or_ladder(position, board=DEFAULT_BOARD):
     """
     Checks if the player is on a ladder or snake position,
     :returns the new position of that player
     """
-    snakes_or_ladder = {1: 40, 8: 10, 36: 52, 43: 62, 49: 79, 65: 82, 68: 85,
-                        24: 5, 33: 3, 42: 30, 56: 37, 64: 27, 74: 12, 87: 70}
-    if position in snakes_or_ladder.keys():
-        return snakes_or_ladder[position]
-    else:
-        return position
+    if 0 <= position < len(board):
+        return board[position]
+    return position
 
 
-def game_ends(players):
+def game_ends(players, goal=GOAL):
     """
     Terminates the game when a player wins
     :returns True if any player is past the finishing line
     """
 
     for player_num, position in enumerate(players):
-        if position >= 90:
+        if position >= goal:
             return True
 
 
 if __name__ == '__main__':
-    num_moves = multi_game_experiment(100, 4, 20)
-    minimum = min(num_moves)
-    maximum = max(num_moves)
-    medianen = median(num_moves)
-    gj_snitt = mean(num_moves)
-    std = stdev(num_moves)
+    stats = multiple_games_stats(100, 4, rand=random.Random(20))
+    minimum = stats.minimum()
+    maximum = stats.maximum()
+    medianen = stats.median()
+    gj_snitt = stats.mean()
+    std = stats.stdev()
 
     print('Minimum :', minimum)
     print('Maximum :', maximum)
@@ -0,0 +1,101 @@
+import random
+import statistics
+
+import numpy as np
+import pytest
+
+import snakes_and_ladders as sl
+
+
+def test_make_board():
+    """Test that a custom board maps starts to ends and sets the goal."""
+    board = sl.make_board([(3, 60), (80, 2)], goal=120)
+    assert len(board) == 126
+    assert board[3] == 60
+    assert board[80] == 2
+    assert board[4] == 4
+    assert sl.make_board() == sl.DEFAULT_BOARD
+    assert sl.check_if_snake_or_ladder(1) == 40
+    assert sl.check_if_snake_or_ladder(100) == 100
+    assert sl.check_if_snake_or_ladder(-1) == -1
+
+
+def test_custom_board_games():
+    """Test that both engines play on a custom board. With a ladder from
+    square 1 to the goal, a first roll of one wins at once, and as every
+    roll moves at least one square no game takes ten moves."""
+    board = sl.make_board({1: 10}, goal=10)
+    python = sl.multiple_games(200, 2, board=board, rand=random.Random(1))
+    numpy = sl.multiple_games(200, 2, 'numpy', board, random.Random(1))
+    assert min(python) == min(numpy) == 1
+    assert all(moves < 10 for moves in python + numpy)
+
+
+def test_batch_games_finish_after_round():
+    """Test that batch games end after the round in which a player
+    reaches the goal, so that a goal of one is always reached in the
+    first round, whatever the number of players."""
+    board = sl.make_board({}, goal=1)
+    rng = np.random.default_rng(1)
+    assert sl.batch_games(50, 3, rng, board).tolist() == [1] * 50
+    with pytest.raises(ValueError):
+        sl.batch_games(1, 0, rng)
+
+
+def test_batch_games_statistics():
+    """Test that the batch engine gives the durations of single_game."""
+    python = sl.multiple_games(3000, 4, rand=random.Random(2))
+    numpy = sl.multiple_games(3000, 4, 'numpy', rand=random.Random(2))
+    assert statistics.mean(numpy) == pytest.approx(statistics.mean(python),
+                                                   rel=0.05)
+    assert statistics.stdev(numpy) == pytest.approx(
+        statistics.stdev(python), rel=0.1)
+    assert min(numpy) >= 1
+
+
+@pytest.mark.parametrize('values', [[7], [3, 9], [5, 1, 5, 2, 8],
+                                    [4, 4, 6, 10, 2, 7]])
+def test_duration_stats(values):
+    """Test DurationStats against the statistics module for odd, even
+    and single counts."""
+    stats = sl.DurationStats()
+    stats.add(values[0])
+    stats.add_many(np.array(values[1:], dtype=np.int64))
+    assert stats.count() == len(values)
+    assert stats.minimum() == min(values)
+    assert stats.maximum() == max(values)
+    assert stats.mean() == pytest.approx(statistics.mean(values))
+    assert stats.median() == statistics.median(values)
+    if len(values) > 1:
+        assert stats.stdev() == pytest.approx(statistics.stdev(values))
+    else:
+        with pytest.raises(statistics.StatisticsError):
+            stats.stdev()
+
+
+@pytest.mark.parametrize('statistic', ['minimum', 'maximum', 'mean',
+                                       'median', 'stdev'])
+def test_duration_stats_no_games(statistic):
+    """Test that every statistic of no games raises StatisticsError."""
+    with pytest.raises(statistics.StatisticsError):
+        getattr(sl.DurationStats(), statistic)()
+
+
+def test_multiple_games_stats():
+    """Test that the collector summarises the games of multiple_games."""
+    num_moves = sl.multiple_games(101, 3, rand=random.Random(4))
+    stats = sl.multiple_games_stats(101, 3, rand=random.Random(4))
+    assert stats.median() == statistics.median(num_moves)
+    assert stats.stdev() == pytest.approx(statistics.stdev(num_moves))
+
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+def test_run_experiments_identical(engine):
+    """Test that experiments give bit-identical results serially, in one
+    worker and in two worker processes."""
+    experiments = [(50, 4, 20), (30, 2, 7), (40, 3, 20)]
+    serial = [sl.multi_game_experiment(*experiment, engine=engine)
+              for experiment in experiments]
+    assert sl.run_experiments(experiments, engine, workers=1) == serial
+    assert sl.run_experiments(experiments, engine, workers=2) == serial
+    assert serial[2] == sl.multi_game_experiment(40, 3, 20, engine)